@@ -1,98 +1,201 @@
 """
 Agent creation and configuration for the GitHub bot
 """
+from __future__ import annotations
 import os
-import autogen
+import re
+import ast
+import sys
+import json
+import hashlib
+import threading
+import functools
 import subprocess
-from autogen import ConversableAgent, AssistantAgent, UserProxyAgent
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 from src import bot_tools
 from src.git_utils import (
     get_github_client,
     get_repository,
     get_issue_comments,
+    get_pull_request,
+    get_pr_numbers,
 )
-from github.Issue import Issue
-import random
-import string
-import triggers
-from urlextract import URLExtract
+from src import triggers
 
+# autogen is only needed once agents are actually created, so it is imported
+# inside the factory functions below
+if TYPE_CHECKING:
+    from autogen import ConversableAgent, AssistantAgent, UserProxyAgent
+    from github.Issue import Issue
 
-# Get callable tool functions
-tool_funcs = []
-for func in dir(bot_tools):
-    if callable(getattr(bot_tools, func)):
-        tool_funcs.append(eval(f'bot_tools.{func}'))
 
+# Tool functions explicitly registered in bot_tools with @tool
+tool_funcs = list(bot_tools.TOOLS)
 
-agent_system_messages = {
-    "file_assistant": """You are a helpful GitHub bot that reviews issues and generates appropriate responses.
-        Analyze the issue details carefully check which files (if any) need to be modified.
-        If not files are given by user, use the tools you have to find and suggest the files that need to be modified.
+# (name, description, function) for each tool, computed once so registration
+# doesn't repeat the attribute lookups for every agent
+TOOL_SPECS = [(fn.__name__, fn.__doc__, fn) for fn in tool_funcs]
+
+# Tool schemas are persisted here so a fresh process doesn't need to
+# introspect every tool again while bot_tools is unchanged
+tools_cache_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    '.tools_cache.json',
+)
+
+
+def _tool_schemas_key() -> dict:
+    """Key identifying the current tool definitions"""
+    return {
+        'bot_tools_mtime': os.path.getmtime(bot_tools.__file__),
+        'tools': [name for name, _, _ in TOOL_SPECS],
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _tool_schemas() -> tuple:
+    """JSON schemas for all tools, built once per process
+
+    register_for_llm re-introspects each function and rebuilds the agent's
+    client for every tool; passing these schemas in llm_config["tools"]
+    when the agent is constructed avoids both. Schemas are loaded from
+    tools_cache_path when it matches the current bot_tools module.
+    """
+    key = _tool_schemas_key()
+    try:
+        with open(tools_cache_path) as f:
+            cached = json.load(f)
+        if cached.get('key') == key:
+            return tuple(cached['schemas'])
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+    from autogen.function_utils import get_function_schema
+    schemas = tuple(
+        get_function_schema(func, name=name, description=description)
+        for name, description, func in TOOL_SPECS
+    )
+    try:
+        with open(tools_cache_path, 'w') as f:
+            json.dump({'key': key, 'schemas': list(schemas)}, f)
+    except (OSError, TypeError) as e:
+        print(f"Could not write tool schema cache: {e}")
+    return schemas
+
+
+# System messages as named constants, shared by every agent built from them.
+# Rules common to several agents are kept in one block so every system
+# message that uses them ends with identical text.
+_COMMON_RULES = """
         DO NOT MAKE ANY CHANGES TO THE FILES OR CREATE NEW FILES. Only provide information or suggestions.
         NEVER ask for user input and NEVER expect it.
+        """
+
+_TERMINATE_RULE = """Reply "TERMINATE" in the end when everything is done.
+        """
+
+_FILE_ASSISTANT_SYSMSG = """You are a helpful GitHub bot that reviews issues and generates appropriate responses.
+        Analyze the issue details carefully check which files (if any) need to be modified.
+        If not files are given by user, use the tools you have to find and suggest the files that need to be modified.
         Return file names that are relevant, and if possible, specific lines where changes can be made.
-        Reply "TERMINATE" in the end when everything is done.
-        """,
-    "edit_assistant": """You are a helpful GitHub bot that reviews issues and generates appropriate responses.
+        """ + _COMMON_RULES + _TERMINATE_RULE
+
+_EDIT_ASSISTANT_SYSMSG = """You are a helpful GitHub bot that reviews issues and generates appropriate responses.
         Analyze the issue details carefully and suggest the changes that need to be made.
         Use to tools available to you to gather information and suggest the necessary changes.
-        DO NOT MAKE ANY CHANGES TO THE FILES OR CREATE NEW FILES. Only provide information or suggestions.
         If no changes are needed, respond accordingly.
-        NEVER ask for user input and NEVER expect it.
         If possible, suggest concrete code changes or additions that can be made. Be specific about what files and what lines.
         Include file paths, line numbers, and exact code changes where possible.
         Format the command in a way that can be parsed by automated tools.
-        Reply "TERMINATE" in the end when everything is done.
-        """,
-    "summary_assistant": """You are a helpful GitHub bot that reviews issues and generates appropriate responses.
+        """ + _COMMON_RULES + _TERMINATE_RULE
+
+_SUMMARY_SYSMSG = """You are a helpful GitHub bot that reviews issues and generates appropriate responses.
         Analyze the issue details carefully and summarize the suggestions and changes made by other agents.
-        """,
-    "feedback_assistant": """You are a helpful GitHub bot that processes user feedback on previous bot responses.
+        """
+
+_FEEDBACK_SYSMSG = """You are a helpful GitHub bot that processes user feedback on previous bot responses.
         Analyze the user's feedback carefully and suggest improvements to the original response.
         Focus on addressing specific concerns raised by the user.
         Maintain a professional and helpful tone.
-        DO NOT MAKE ANY CHANGES TO THE FILES OR CREATE NEW FILES. Only provide information or suggestions.
         If no changes are needed, respond accordingly.
-        NEVER ask for user input and NEVER expect it.
         If possible, suggest concrete code changes or additions that can be made. Be specific about what files and what lines.
         Provide code blocks where you can.
         Include any relevant code snippets or technical details from the original response that should be preserved.
-        """,
-    "generate_edit_command_assistant": """You are a helpful GitHub bot that synthesizes all discussion in an issue thread to generate a command for a bot to make edits.
+        """ + _COMMON_RULES
+
+_GEN_EDIT_CMD_SYSMSG = """You are a helpful GitHub bot that synthesizes all discussion in an issue thread to generate a command for a bot to make edits.
         Analyze the issue details and comments carefully to generate a detailed and well-organized command.
         Ensure the command provides enough information for the downstream bot to make changes accurately.
         NEVER ask for user input and NEVER expect it.
         Provide code blocks where you can.
-        Reply "TERMINATE" in the end when everything is done.
-        """,
-    'comment_summary_assistant': """You are a helpful GitHub bot that reviews issue comments and generates a summary in the context of the given prompt.
+        """ + _TERMINATE_RULE
+
+_COMMENT_SUMMARY_SYSMSG = """You are a helpful GitHub bot that reviews issue comments and generates a summary in the context of the given prompt.
     Your goal is to summarize all relevant information from the comments in the context of the prompt.
     If no relevant information is found, respond accordingly.
-        Reply "TERMINATE" in the end when everything is done.
-        """,
+        """ + _TERMINATE_RULE
+
+_CODEACT_SYSMSG = """You are a helpful GitHub bot that reviews issues and generates appropriate responses.
+        Instead of calling tools one at a time, write a single Python program that gathers everything needed to address the issue.
+        The program can call these functions directly: """ + ", ".join(name for name, _, _ in TOOL_SPECS) + """.
+        Use print() to output everything you find. Imports, function definitions and private attributes are not allowed.
+        Reply with exactly one ```python code block.
+        """ + _COMMON_RULES
+
+
+def _compact_message(message: str) -> str:
+    """Drop the source indentation and blank lines from a system message
+
+    System messages are sent with every LLM call, so the indentation from
+    the triple-quoted literals would otherwise be paid for on every turn.
+    """
+    lines = (line.strip() for line in message.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+_SYSTEM_MESSAGES = {
+    "file_assistant": _FILE_ASSISTANT_SYSMSG,
+    "edit_assistant": _EDIT_ASSISTANT_SYSMSG,
+    "summary_assistant": _SUMMARY_SYSMSG,
+    "feedback_assistant": _FEEDBACK_SYSMSG,
+    "generate_edit_command_assistant": _GEN_EDIT_CMD_SYSMSG,
+    'comment_summary_assistant': _COMMENT_SUMMARY_SYSMSG,
+    "codeact_assistant": _CODEACT_SYSMSG,
+}
+
+agent_system_messages = {
+    name: _compact_message(message) for name, message in _SYSTEM_MESSAGES.items()
 }
 
+# Agents that answer in code rather than with tool calls
+_AGENTS_WITHOUT_TOOLS = {"codeact_assistant"}
+
 
 def register_functions(
         agent: ConversableAgent | AssistantAgent | UserProxyAgent,
         register_how: str = "llm",
-        tool_funcs: list = tool_funcs,
+        tool_specs: list = TOOL_SPECS,
 ) -> ConversableAgent | AssistantAgent | UserProxyAgent:
     """Register tool functions with the agent
 
+    Agents built by create_agent get their tool schemas through llm_config
+    instead, so "llm" registration is only needed for agents made elsewhere.
+
     Args:
         agent: Agent to register functions with
+        register_how: "llm" or "execution"
+        tool_specs: List of (name, description, function) tuples
     """
-    for this_func in tool_funcs:
+    for name, description, this_func in tool_specs:
         if register_how == "llm":
             agent.register_for_llm(
-                name=this_func.__name__,
-                description=this_func.__doc__,
+                name=name,
+                description=description,
             )(this_func)
         elif register_how == "execution":
             agent.register_for_execution(
-                name=this_func.__name__)(this_func)
+                name=name)(this_func)
         else:
             raise ValueError(
                 "Invalid registration method, must be 'llm' or 'execution'")
@@ -103,70 +206,181 @@ def register_functions(
 ############################################################
 
 
+# "TERMINATE" at the end of a message, ignoring trailing punctuation/space
+_TERMINATE_RE = re.compile(r'TERMINATE[\W_]*\Z')
+
+
 def is_terminate_msg(x: dict) -> bool:
     """
     Returns true if terminate conditions are met
     """
-    content = x['content']
-    # Remove punctuation
-    if type(content) is str:
-        clean_content = content.translate(
-            str.maketrans('', '', string.punctuation))
-        return bool(clean_content) and clean_content.rstrip().endswith("TERMINATE")
-    else:
-        return x.get("content", "") and x.get("content", "").rstrip().endswith("TERMINATE")
+    content = x.get('content') or ''
+    # Only the tail of the message can match, so don't scan the whole thing
+    return isinstance(content, str) and bool(
+        _TERMINATE_RE.search(content[-64:]))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_http_client():
+    """HTTP client shared by all agents, so they reuse one connection pool"""
+    import httpx
+
+    class SharedHTTPClient(httpx.Client):
+        """httpx.Client that survives autogen deep-copying llm_config
+
+        The client holds locks and sockets, so it can't be deep-copied; the
+        copy returns the same client instead, which is also what keeps the
+        connection pool shared.
+        """
+
+        def __deepcopy__(self, memo):
+            return self
+
+    return SharedHTTPClient(
+        limits=httpx.Limits(max_keepalive_connections=20))
+
+
+# Agents are reused across issues within a process, so construction and tool
+# registration only happen once per agent/config combination. An agent is
+# taken out of its pool while in use, so overlapping flows never share one;
+# release_agents puts it back.
+_idle_agents = {}
+_checked_out_agents = {}
+_agent_lock = threading.Lock()
+
+
+def _llm_config_key(llm_config: dict) -> str:
+    """Short hash of the full llm_config (dicts can't be used as keys)"""
+    config_json = json.dumps(llm_config, sort_keys=True, default=str)
+    return hashlib.blake2b(config_json.encode(), digest_size=8).hexdigest()
+
+
+def reset_agents() -> None:
+    """Clear cached agents (mainly for tests)"""
+    with _agent_lock:
+        _idle_agents.clear()
+        _checked_out_agents.clear()
+
+
+def _checkout_agent(pool_key: tuple):
+    """Take an idle agent from the pool for pool_key, or None if empty"""
+    with _agent_lock:
+        idle = _idle_agents.get(pool_key)
+        return idle.pop() if idle else None
+
+
+def _register_checkout(agent, pool_key: tuple):
+    """Record which pool a handed-out agent returns to, and clear its history"""
+    with _agent_lock:
+        _checked_out_agents[id(agent)] = (pool_key, agent)
+    agent.reset()
+    return agent
+
+
+def release_agents(*agents) -> None:
+    """Return agents from create_user_agent/create_agent to their pools
+
+    Call this once the chats using the agents have finished.
+    """
+    with _agent_lock:
+        for agent in agents:
+            pool_key, _ = _checked_out_agents.pop(id(agent), (None, None))
+            if pool_key is not None:
+                _idle_agents.setdefault(pool_key, []).append(agent)
 
 
 def create_user_agent():
-    """Create and configure the user agent"""
+    """Create and configure the user agent
 
-    user = UserProxyAgent(
-        name="User",
-        human_input_mode="NEVER",
-        is_termination_msg=is_terminate_msg,
-        code_execution_config=False
-    )
+    Agents are pooled, and the one handed out is used only by the caller
+    (with its chat history cleared) until it is passed to release_agents.
+    """
+    pool_key = ("User",)
+    user = _checkout_agent(pool_key)
+    if user is None:
+        from autogen import UserProxyAgent
+
+        user = UserProxyAgent(
+            name="User",
+            human_input_mode="NEVER",
+            is_termination_msg=is_terminate_msg,
+            code_execution_config=False
+        )
 
-    user = register_functions(user, register_how="execution")
+        user = register_functions(user, register_how="execution")
 
-    return user
+    return _register_checkout(user, pool_key)
 
 
 def create_agent(agent_name: str, llm_config: dict) -> AssistantAgent:
-    """Create and configure the autogen agents"""
+    """Create and configure the autogen agents
 
-    agent = AssistantAgent(
-        name=agent_name,
-        llm_config=llm_config,
-        system_message=agent_system_messages[agent_name],
-    )
+    Agents are pooled per (agent_name, llm_config), and the one handed out
+    is used only by the caller (with its chat history cleared) until it is
+    passed to release_agents.
+    """
+    pool_key = (agent_name, _llm_config_key(llm_config))
+    agent = _checkout_agent(pool_key)
+    if agent is None:
+        from autogen import AssistantAgent
 
-    agent = register_functions(agent, register_how="llm")
+        agent_llm_config = {**llm_config,
+                            "http_client": _get_http_client()}
+        if agent_name not in _AGENTS_WITHOUT_TOOLS:
+            agent_llm_config["tools"] = list(_tool_schemas())
 
-    return agent
+        agent = AssistantAgent(
+            name=agent_name,
+            llm_config=agent_llm_config,
+            system_message=agent_system_messages[agent_name],
+        )
+
+    return _register_checkout(agent, pool_key)
 
 ############################################################
 # Prompt generation
 ############################################################
 
 
-def parse_comments(repo_name: str, repo_path: str, details: dict, issue: Issue) -> str:
-    """Parse comments for the issue or pull request"""
-    from git_utils import has_linked_pr, get_linked_pr
+# Maximum number of tokens of earlier comment history included in prompts
+comment_token_budget = 4000
 
-    comments_objs = get_issue_comments(issue)
-    repo = get_repository(get_github_client(), repo_name)
 
-    # If there's a linked PR, also get its comments
-    pr_comment_bool, pr_comment = triggers.has_pr_creation_comment(issue)
-    if pr_comment_bool:
-        extractor = URLExtract()
-        urls = extractor.find_urls(pr_comment)[0]
-        pr_number = int(urls.split('/')[-1])
-        pr = repo.get_pull(pr_number)
-        pr_comments = get_issue_comments(pr)
-        comments_objs.extend(pr_comments)
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Get (and cache) the tiktoken encoding for a model"""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _truncate_to_tokens(text: str, budget: int, model: str = 'gpt-4o') -> str:
+    """Keep only the most recent `budget` tokens of text
 
+    Args:
+        text: Text to truncate
+        budget: Maximum number of tokens to keep
+        model: Model whose tokenizer is used to count tokens
+
+    Returns:
+        Text unchanged if within budget, otherwise its tail with a note
+        about how much was dropped
+    """
+    # A token is at least one character, so short text can't exceed budget
+    if len(text) <= budget:
+        return text
+    encoding = _get_encoding(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= budget:
+        return text
+    kept = encoding.decode(tokens[-budget:])
+    return f"[... {len(tokens) - budget} tokens of earlier comments truncated ...]\n{kept}"
+
+
+def _format_comments(comments_objs: list) -> tuple:
+    """Format comment objects into (last_comment_str, comments_str, all_comments)"""
     all_comments = [c.body for c in comments_objs]
     if len(all_comments) == 0:
         last_comment_str = ""
@@ -175,50 +389,81 @@ def parse_comments(repo_name: str, repo_path: str, details: dict, issue: Issue)
         last_comment_str = f"Last comment: {all_comments[0]}"
         comments_str = ""
     else:
-        comments = "\n".join([c.body for c in comments_objs[:-1]])
-        last_comment_str = f"Last comment: {comments_objs[-1].body}"
+        comments = "\n".join(all_comments[:-1])
+        comments = _truncate_to_tokens(comments, budget=comment_token_budget)
+        last_comment_str = f"Last comment: {all_comments[-1]}"
         comments_str = f"Also think of these comments as part of the response context:\n    {comments}"
 
     return last_comment_str, comments_str, all_comments
 
 
-def generate_prompt(
-        agent_name: str,
+def parse_comments(
         repo_name: str,
         repo_path: str,
         details: dict,
         issue: Issue,
-        results_to_summarize: list = [],
-        original_response: str = "",
-        feedback_text: str = "",
-        agent_system_messages: dict = agent_system_messages,
-        summarized_comments_str: str = "",
 ) -> str:
-    """Generate prompt for the agent"""
-    last_comment_str, comments_str, all_comments = parse_comments(
-        repo_name, repo_path, details, issue)
+    """Parse comments for the issue or pull request
 
-    # Add URL content information if available
-    url_content_str = ""
-    if 'url_contents' in details and details['url_contents']:
-        url_content_str = "\nURLs found in issue:\n"
-        for url, content in details['url_contents'].items():
-            # Truncate content preview to avoid extremely long prompts
-            content_preview = content[:500] + \
-                "..." if len(content) > 500 else content
-            url_content_str += f"\n- URL: {url}\n- Content preview: {content_preview}\n"
-
-    boilerplate_text = f"""
-        Repository: {repo_name}
-        Local path: {repo_path}
-        Title: {details['title']}
-        Body: {details['body']}
-        {last_comment_str}
-        {url_content_str}
-        """
+    Args:
+        repo_name: Full name of repository (owner/repo)
+        repo_path: Local path to repository
+        details: Dictionary with issue details
+        issue: The GitHub issue object
+    """
+    comments_objs = get_issue_comments(issue)
+
+    # If there's a linked PR, also get its comments
+    pr_comment_bool, pr_comment = triggers.has_pr_creation_comment(issue)
+    pr_numbers = get_pr_numbers(pr_comment) if pr_comment_bool else []
+    if pr_numbers:
+        repo = get_repository(get_github_client(), repo_name)
+
+        def _get_pr_comments(pr_number):
+            return get_issue_comments(get_pull_request(repo, pr_number))
+
+        # Fetch all linked PRs at the same time
+        with ThreadPoolExecutor(max_workers=min(len(pr_numbers), 4)) as executor:
+            for pr_comments in executor.map(_get_pr_comments, pr_numbers):
+                comments_objs = comments_objs + pr_comments
+
+    return _format_comments(comments_objs)
+
+
+def parse_comment_summaries(response: str, n_comments: int) -> list:
+    """Parse the JSON reply of a batched comment_summary_assistant call
+
+    Args:
+        response: Raw reply from the agent
+        n_comments: Number of comments that were in the batch
 
-    if agent_name == "file_assistant":
-        return f"""Please analyze this GitHub issue and suggest files that need to be modified to address the issue.
+    Returns:
+        List with one summary per comment ("" for irrelevant comments)
+    """
+    match = re.search(r'\[.*\]', response or "", flags=re.DOTALL)
+    try:
+        entries = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError:
+        entries = None
+    if not isinstance(entries, list):
+        # Couldn't parse the reply, keep it as a single summary so nothing
+        # relevant is lost
+        return [response or ""]
+
+    summaries = [""] * n_comments
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        ind = entry.get("comment", i + 1)
+        if not isinstance(ind, int) or not 1 <= ind <= n_comments:
+            continue
+        if entry.get("relevant"):
+            summaries[ind - 1] = str(entry.get("summary", ""))
+    return summaries
+
+
+# Prompt templates, filled in with str.format_map by generate_prompt
+_FILE_ANALYSIS_TEMPLATE = """Please analyze this GitHub issue and suggest files that need to be modified to address the issue.
 
     {boilerplate_text}
 
@@ -237,8 +482,8 @@ def generate_prompt(
 
     Reply "TERMINATE" in the end when everything is done.
     """
-    elif agent_name == "edit_assistant":
-        return f"""Suggest what changes can be made to resolve this issue:
+
+_EDIT_SUGGESTION_TEMPLATE = """Suggest what changes can be made to resolve this issue:
     {boilerplate_text}
 
     {comments_str}
@@ -275,38 +520,7 @@ def generate_prompt(
 
     Reply "TERMINATE" in the end when everything is done."""
 
-    elif agent_name == "feedback_assistant":
-        return f"""Process this user feedback on the previous bot response and generate an improved response:
-    Repository: {repo_name}
-    Local path: {repo_path}
-
-    Use the tools you have. Do not ask for user input or expect it.
-    DO NOT SUGGEST CODE EXECUTIONS. Only make code editing suggestions.
-    If those are not functioning, use tools like search_for_file to search for .py files, or other tools you have.
-    Try to read the whole file (readfile) to understand context where possible. If file is too large, search for specific functions or classes (get_func_code). If you can't find functions to classes, try reading sets of lines repeatedly (readlines).
-    If you're unsure about a suggested change, use search_github to find similar code snippets in the repository.
-    Finish the job by suggesting specific lines in specific files where changes can be made.
-
-    Previous Response:
-    {original_response}
-
-    User Feedback:
-    {feedback_text}
-
-    Please generate an updated response that addresses the feedback while maintaining any useful information from the original response.
-    Reply "TERMINATE" when done.
-    """
-
-    elif agent_name == "summary_assistant":
-        results_to_summarize = "\n".join(results_to_summarize)
-        return f"Summarize the suggestions and changes made by the other agents. Repeat any code snippets as is.\n\n{results_to_summarize}\n"
-
-    elif agent_name == "generate_edit_command_assistant":
-        if summarized_comments_str != "":
-            generate_edit_context = summarized_comments_str
-        else:
-            generate_edit_context = comments_str
-        return f"""Please analyze this GitHub issue and generate a detailed edit command:
+_GENERATE_EDIT_COMMAND_TEMPLATE = """Please analyze this GitHub issue and generate a detailed edit command:
             **Focus specifically on the last comment (if it is relevant).**
 
     {boilerplate_text}
@@ -345,25 +559,337 @@ def generate_prompt(
     Reply "TERMINATE" in the end when everything is done.
     """
 
-    elif agent_name == "comment_summary_assistant":
-        return f"""Summarize all relevant information from the comment in the context of the given prompt.
-    If the comment is relevant to the current prompt, reply "IS_RELEVANT" along with a summary of the comment, and then terminate the conversation.
+_FEEDBACK_TEMPLATE = """Process this user feedback on the previous bot response and generate an improved response:
+    Repository: {repo_name}
+    Local path: {repo_path}
+
+    Use the tools you have. Do not ask for user input or expect it.
+    DO NOT SUGGEST CODE EXECUTIONS. Only make code editing suggestions.
+    If those are not functioning, use tools like search_for_file to search for .py files, or other tools you have.
+    Try to read the whole file (readfile) to understand context where possible. If file is too large, search for specific functions or classes (get_func_code). If you can't find functions to classes, try reading sets of lines repeatedly (readlines).
+    If you're unsure about a suggested change, use search_github to find similar code snippets in the repository.
+    Finish the job by suggesting specific lines in specific files where changes can be made.
+
+    Previous Response:
+    {original_response}
+
+    User Feedback:
+    {feedback_text}
+
+    Please generate an updated response that addresses the feedback while maintaining any useful information from the original response.
+    Reply "TERMINATE" when done.
+    """
+
+_SUMMARY_TEMPLATE = "Summarize the suggestions and changes made by the other agents. Repeat any code snippets as is.\n\n{results_to_summarize}\n"
+
+_COMMENT_SUMMARY_TEMPLATE = """Summarize all relevant information from each comment in the context of the given prompt.
     Include any filenames, line numbers, or code snippets that are relevant to the prompt, in the summary.
-    If no relevant information is found, respond "NOT_RELEVANT" (without a summary), and then terminate.
+    Each comment is numbered and must be handled independently.
 
     Prompt:
     ========================================
     {feedback_text}
     ========================================
 
-    Comment to summarize:
+    Comments to summarize:
     ========================================
-        {results_to_summarize[0]}
+    {numbered_comments}
     ========================================
 
+    Respond with a JSON list containing exactly one object per comment, in order:
+    [{{"comment": 1, "relevant": true, "summary": "..."}}, ...]
+    If a comment has no relevant information, set "relevant" to false and "summary" to "".
+
     Reply "TERMINATE" in the end when everything is done.
     """
 
-    else:
+_BOILERPLATE_TEMPLATE = """
+        Repository: {repo_name}
+        Local path: {repo_path}
+        Title: {title}
+        Body: {body}
+        {last_comment_str}
+        {url_content_str}
+        """
+
+_CODEACT_TEMPLATE = """Write a Python program that gathers the files and code needed to address this GitHub issue:
+
+    {boilerplate_text}
+
+    {comments_str}
+
+    Start by finding the relevant files, then print the functions, classes or lines that need to change.
+    """
+
+_CODEACT_ANSWER_TEMPLATE = """This is the output of your program:
+    ========================================
+    {program_output}
+    ========================================
+
+    Using this output, suggest the changes needed to resolve the issue.
+    Do not write another program.
+
+    Format your output with the following structure:
+    - Summary of user's issues and requests
+    - Overview of plan to address the issues
+    - Specific details of changes to be made, with file paths, line numbers and code snippets of the edits
+    """
+
+# Prompts built from the issue details and comments
+_PROMPTS_WITH_ISSUE_CONTEXT = {
+    "file_assistant",
+    "edit_assistant",
+    "generate_edit_command_assistant",
+    "codeact_assistant",
+}
+
+_PROMPT_TEMPLATES = {
+    "file_assistant": _FILE_ANALYSIS_TEMPLATE,
+    "edit_assistant": _EDIT_SUGGESTION_TEMPLATE,
+    "feedback_assistant": _FEEDBACK_TEMPLATE,
+    "summary_assistant": _SUMMARY_TEMPLATE,
+    "generate_edit_command_assistant": _GENERATE_EDIT_COMMAND_TEMPLATE,
+    "comment_summary_assistant": _COMMENT_SUMMARY_TEMPLATE,
+    "codeact_assistant": _CODEACT_TEMPLATE,
+}
+
+
+# Number of characters of each URL's content shown in prompts
+url_preview_length = 500
+
+
+def get_url_previews(url_contents: dict) -> list:
+    """Truncate scraped URL contents to the previews shown in prompts
+
+    Args:
+        url_contents: Dict mapping each URL to its content
+
+    Returns:
+        List of (url, preview) tuples
+    """
+    return [
+        (url, content[:url_preview_length] + "..."
+         if len(content) > url_preview_length else content)
+        for url, content in url_contents.items()
+    ]
+
+
+def generate_prompt(
+        agent_name: str,
+        repo_name: str,
+        repo_path: str,
+        details: dict,
+        issue: Issue,
+        results_to_summarize: list = [],
+        original_response: str = "",
+        feedback_text: str = "",
+        agent_system_messages: dict = agent_system_messages,
+        summarized_comments_str: str = "",
+) -> str:
+    """Generate prompt for the agent"""
+    if agent_name not in _PROMPT_TEMPLATES:
         raise ValueError(
             f"Invalid agent name: {agent_name}\nOptions are:\n{agent_system_messages.keys()}")
+
+    # Only some prompts include the issue and its comments, the rest don't
+    # need the comments to be fetched and formatted at all
+    if agent_name not in _PROMPTS_WITH_ISSUE_CONTEXT:
+        return _PROMPT_TEMPLATES[agent_name].format_map({
+            'repo_name': repo_name,
+            'repo_path': repo_path,
+            'original_response': original_response,
+            'feedback_text': feedback_text,
+            'results_to_summarize': "\n".join(results_to_summarize),
+            'numbered_comments': "\n".join(
+                f"### Comment {i}\n{comment}\n"
+                for i, comment in enumerate(results_to_summarize, start=1)
+            ),
+        })
+
+    # collect_issue_context stores the comments it parsed in the details
+    parsed_comments = details.get('parsed_comments')
+    if parsed_comments is None:
+        parsed_comments = parse_comments(repo_name, repo_path, details, issue)
+    last_comment_str, comments_str, all_comments = parsed_comments
+
+    # Add URL content information if available
+    url_previews = details.get('url_previews')
+    if url_previews is None:
+        url_previews = get_url_previews(details.get('url_contents') or {})
+    url_content_str = ""
+    if url_previews:
+        url_content_str = "\nURLs found in issue:\n" + "".join(
+            f"\n- URL: {url}\n- Content preview: {preview}\n"
+            for url, preview in url_previews
+        )
+
+    boilerplate_text = _BOILERPLATE_TEMPLATE.format_map({
+        'repo_name': repo_name,
+        'repo_path': repo_path,
+        'title': details['title'],
+        'body': details['body'],
+        'last_comment_str': last_comment_str,
+        'url_content_str': url_content_str,
+    })
+
+    # The edit command uses the summarized comments when they're available
+    if summarized_comments_str != "":
+        generate_edit_context = summarized_comments_str
+    else:
+        generate_edit_context = comments_str
+
+    return _PROMPT_TEMPLATES[agent_name].format_map({
+        'boilerplate_text': boilerplate_text,
+        'comments_str': comments_str,
+        'generate_edit_context': generate_edit_context,
+    })
+
+
+def generate_codeact_answer_prompt(program_output: str) -> str:
+    """Prompt asking the codeact_assistant to answer from its program's output"""
+    return _CODEACT_ANSWER_TEMPLATE.format_map(
+        {'program_output': program_output})
+
+############################################################
+# CodeAct execution
+############################################################
+
+
+# Maximum number of characters of program output passed back to the model
+codeact_output_limit = 50_000
+
+# Seconds a CodeAct program may run before it is stopped
+codeact_timeout = 120
+
+# Address space limit (in bytes) for the process running a CodeAct program,
+# where the platform supports it
+codeact_memory_limit = 2 * 1024 ** 3
+
+# Builtins available to CodeAct programs besides the tools
+_CODEACT_BUILTINS = (
+    'print', 'len', 'range', 'enumerate', 'zip', 'sorted', 'reversed',
+    'min', 'max', 'sum', 'any', 'all', 'str', 'int', 'float', 'bool',
+    'list', 'dict', 'set', 'tuple', 'isinstance', 'repr',
+)
+
+_CODE_BLOCK_RE = re.compile(r'```(?:python|py)?\s*\n(.*?)```', flags=re.DOTALL)
+
+# Script run in a child process by run_codeact_program. It reads the program
+# from stdin; argv holds the allowed builtins and the memory limit.
+_CODEACT_RUNNER = """
+import sys
+import builtins
+
+try:
+    import resource
+    memory_limit = int(sys.argv[2])
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+except (ImportError, ValueError, OSError):
+    pass
+
+from src import bot_tools
+
+namespace = {fn.__name__: fn for fn in bot_tools.TOOLS}
+namespace['__builtins__'] = {
+    name: getattr(builtins, name) for name in sys.argv[1].split(',')}
+code = sys.stdin.read()
+try:
+    exec(compile(code, '<codeact>', 'exec'), namespace)
+except Exception as e:
+    print(f"\\nError running program: {type(e).__name__}: {e}")
+"""
+
+
+def _check_codeact_program(tree: ast.AST, allowed_calls: set) -> None:
+    """Raise ValueError if the program uses anything outside the whitelist
+
+    This guards against mistakes in generated code (the same code the
+    agents could already run through tool calls), not against a hostile
+    program.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.Global,
+                             ast.Nonlocal, ast.FunctionDef,
+                             ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+            raise ValueError(
+                f"{type(node).__name__} is not allowed (line {node.lineno})")
+        if isinstance(node, ast.Attribute) and (
+                node.attr.startswith('_') or node.attr in ('format', 'format_map')):
+            raise ValueError(
+                f"Attribute {node.attr} is not allowed (line {node.lineno})")
+        if isinstance(node, ast.Name) and node.id.startswith('_'):
+            raise ValueError(
+                f"Name {node.id} is not allowed (line {node.lineno})")
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id not in allowed_calls:
+            raise ValueError(
+                f"Call to {node.func.id} is not allowed (line {node.lineno})")
+
+
+def run_codeact_program(reply: str) -> str:
+    """Run the Python program in a codeact_assistant reply
+
+    The program runs in a separate Python process with only the bot tools
+    and a few builtins available, and is stopped after codeact_timeout
+    seconds. Errors are returned as part of the output so the model can see
+    what went wrong.
+
+    Args:
+        reply: Agent reply containing a ```python code block
+
+    Returns:
+        Captured stdout of the program
+    """
+    match = _CODE_BLOCK_RE.search(reply or "")
+    code = match.group(1) if match else (reply or "")
+
+    allowed_calls = {name for name, _, _ in TOOL_SPECS} | set(_CODEACT_BUILTINS)
+    try:
+        _check_codeact_program(ast.parse(code), allowed_calls)
+    except Exception as e:
+        return f"\nError running program: {type(e).__name__}: {e}\n"
+
+    cmd = [sys.executable, '-c', _CODEACT_RUNNER,
+           ','.join(_CODEACT_BUILTINS), str(codeact_memory_limit)]
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(
+        x for x in (bot_tools.base_dir, os.environ.get('PYTHONPATH')) if x)}
+    with subprocess.Popen(cmd, env=env, stdin=subprocess.PIPE,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True) as proc:
+        timer = threading.Timer(codeact_timeout, proc.kill)
+        timer.start()
+        # Drain stderr alongside stdout so neither pipe can fill up and
+        # block the process
+        stderr = []
+        stderr_thread = threading.Thread(
+            target=lambda: stderr.append(proc.stderr.read()))
+        stderr_thread.start()
+        try:
+            proc.stdin.write(code)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        kept = []
+        n_kept = 0
+        n_total = 0
+        for chunk in iter(lambda: proc.stdout.read(65536), ''):
+            n_total += len(chunk)
+            if n_kept < codeact_output_limit:
+                kept.append(chunk[:codeact_output_limit - n_kept])
+                n_kept += len(kept[-1])
+        stderr_thread.join()
+        returncode = proc.wait()
+        timed_out = not timer.is_alive()
+        timer.cancel()
+
+    program_output = "".join(kept)
+    if n_total > n_kept:
+        program_output += "\n[... output truncated ...]"
+    if timed_out:
+        program_output += ("\nError running program: TimeoutError: "
+                           f"stopped after {codeact_timeout} seconds\n")
+    elif returncode:
+        program_output += ("\nError running program: exited with code "
+                           f"{returncode}: {''.join(stderr)[-1000:]}\n")
+    return program_output
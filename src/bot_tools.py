@@ -2,18 +2,99 @@
 Tools for the agents to use.
 
 DO NOT PUT ANYTHING HERE THAT IS NOT SAFE FOR THE AGENT TO USE.
-ALSO CAN'T HAVE CALLABLE MODULES.
+Only functions decorated with @tool are registered with the agents.
 """
 
+import io
 import os
-import sys
+import re
+import ast
+import mmap
+import shutil
+import bisect
+import fnmatch
+import itertools
+import functools
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 src_dir = os.path.dirname(os.path.abspath(__file__))
 base_dir = os.path.dirname(src_dir)
 
 token_threshold = 100_000
 
+# Seconds a search command may run before it is stopped
+search_timeout = 30
 
+# Files larger than this (in bytes) are streamed by readfile, stopping
+# once token_threshold is reached, instead of being read in full
+large_file_size = 256 * 1024
+
+# Maximum number of files/searches the batched tools run at once
+max_parallel_tools = 8
+
+# ripgrep, if installed; looked up once instead of on every search
+_RG_PATH = shutil.which("rg")
+
+# grep and git grep are noticeably faster without locale-aware (multibyte)
+# matching
+_C_LOCALE_ENV = {**os.environ, "LC_ALL": "C"}
+
+# Patterns made only of identifier characters contain no regex syntax
+_LITERAL_RE = re.compile(r'[A-Za-z0-9_]+\Z')
+
+# Start of a function definition, used by get_func_code
+_FUNC_DEF_RE = re.compile(r'\s*(?:async\s+)?def\s+\w+\s*\(')
+
+# Functions exposed to the agents, in definition order
+TOOLS = []
+
+
+def tool(func):
+    """Register a function as an agent tool"""
+    TOOLS.append(func)
+    return func
+
+
+class _SearchError(Exception):
+    """A search command failed; the message is returned to the agent"""
+
+
+def _run_search(cmd: list, env: dict = None) -> str:
+    """Run a search command (argument list, no shell) and return its stdout
+
+    grep, git grep and rg exit with 1 when nothing matches and with 2 on
+    errors (e.g. an invalid regex).
+
+    Raises:
+        _SearchError: If the command times out, or fails without output.
+            Results found before an error (e.g. an unreadable file) are
+            still returned.
+    """
+    print(" ".join(cmd))
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True,
+                                timeout=search_timeout, env=env)
+    except subprocess.TimeoutExpired:
+        raise _SearchError(
+            f"Search timed out after {search_timeout} seconds: {' '.join(cmd)}")
+    if result.returncode > 1:
+        if not result.stdout:
+            raise _SearchError(f"Search failed: {result.stderr.strip()}")
+        print(result.stderr.strip())
+    return result.stdout
+
+
+# Local paths of repositories that have been found, keyed by repo name
+_local_repo_paths = {}
+
+
+def refresh_repos() -> None:
+    """Forget cached repository paths, e.g. after repos are removed"""
+    _local_repo_paths.clear()
+
+
+@tool
 def get_local_repo_path(repo_name: str) -> str:
     """
     Get the path to the local repository
@@ -25,16 +106,79 @@ def get_local_repo_path(repo_name: str) -> str:
     Returns:
         - Path to the local repository
     """
+    if repo_name in _local_repo_paths:
+        return _local_repo_paths[repo_name]
+
     local_path = os.path.join(base_dir, 'repos')
 
     # Construct full path for clone
     repo_path = os.path.join(local_path, repo_name)
     if os.path.exists(repo_path):
+        # Only found repos are cached, a missing one may be cloned later
+        _local_repo_paths[repo_name] = repo_path
         return repo_path
     else:
         return f"Repository {repo_name} not found @ {repo_path}"
 
 
+def _grep_parallel(search_dir: str, pattern_args: list, options: list) -> str:
+    """Search search_dir with grep, one process per top-level subdirectory
+
+    grep only uses one core, so the subtrees are searched concurrently.
+    Python files directly in search_dir are searched by one more process.
+    As with grep -r, symbolic links inside search_dir are not followed.
+    """
+    try:
+        with os.scandir(search_dir) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+    except OSError as e:
+        # Same message grep itself gives for a missing directory
+        raise _SearchError(f"Search failed: grep: {search_dir}: {e.strerror}")
+    targets = [[entry.path] for entry in entries
+               if entry.is_dir(follow_symlinks=False)]
+    top_files = [entry.path for entry in entries
+                 if entry.is_file(follow_symlinks=False)
+                 and entry.name.endswith(".py")]
+    if top_files:
+        targets.append(top_files)
+
+    def _grep(paths):
+        cmd = ["grep", "-irl", *options, "--include=*.py",
+               *pattern_args, *paths]
+        return _run_search(cmd, env=_C_LOCALE_ENV)
+
+    if not targets:
+        return ""
+    with ThreadPoolExecutor(
+            max_workers=min(os.cpu_count() or 1, len(targets))) as executor:
+        return "".join(executor.map(_grep, targets))
+
+
+def _search_files(search_dir: str, patterns: list) -> str:
+    """Python files in search_dir matching any of patterns, one per line"""
+    # Fixed-string matching is much faster than running the regex engine
+    fixed = ["-F"] if all(_LITERAL_RE.match(p) for p in patterns) else []
+    pattern_args = [arg for pattern in patterns for arg in ("-e", pattern)]
+    # In a git repository, git grep reads the file list from the index
+    # instead of walking the tree. --untracked also searches new files that
+    # aren't committed yet; ignored files are skipped.
+    if os.path.isdir(os.path.join(search_dir, ".git")):
+        cmd = ["git", "-C", search_dir, "grep", "-Ili", *fixed, "--untracked",
+               "--threads=0", *pattern_args, "--", "*.py"]
+        out = _run_search(cmd, env=_C_LOCALE_ENV)
+        # git grep prints paths relative to search_dir
+        return "".join(os.path.join(search_dir, line) + "\n"
+                       for line in out.splitlines())
+    # ripgrep walks the tree in parallel and skips .gitignore'd files
+    elif _RG_PATH:
+        cmd = [_RG_PATH, "--files-with-matches", "-i", *fixed,
+               "--type=py", *pattern_args, search_dir]
+        return _run_search(cmd)
+    else:
+        return _grep_parallel(search_dir, pattern_args, fixed)
+
+
+@tool
 def search_for_pattern(
         search_dir: str,
         pattern: str,
@@ -42,6 +186,9 @@ def search_for_pattern(
     """
     Search for a pattern in a directory.
     Can only search for python files.
+    In git repositories, files ignored by .gitignore are not searched.
+    Plain identifiers (letters, digits, underscores) are matched literally,
+    anything else is treated as a regular expression.
 
     Inputs:
         - search_dir : Directory to search
@@ -50,13 +197,97 @@ def search_for_pattern(
     Returns:
         - Path to files with pattern
     """
-    run_str = f"grep -irl {pattern} {search_dir} --include='*.py'"
-    print(run_str)
-    # out = os.system(run_str)
-    out = os.popen(run_str).read()
-    return out
+    try:
+        return _search_files(search_dir, [pattern])
+    except _SearchError as e:
+        return str(e)
+
+
+@tool
+def search_for_patterns(
+        search_dir: str,
+        patterns: list[str],
+) -> str:
+    """
+    Search for several patterns in a directory at once.
+    Can only search for python files.
+
+    Inputs:
+        - search_dir : Directory to search
+        - patterns : Patterns to search for
+
+    Returns:
+        - Path to files with each pattern
+    """
+    if patterns and all(_LITERAL_RE.match(p) for p in patterns):
+        # Plain identifiers: walk the tree once for files matching any of
+        # them, then check which identifiers each (usually small) set of
+        # candidate files contains
+        try:
+            candidates = _search_files(search_dir, patterns).splitlines()
+        except _SearchError as e:
+            return str(e)
+        matches = {pattern: [] for pattern in patterns}
+        for path in candidates:
+            try:
+                with open(path, 'r', errors='ignore') as file:
+                    text = file.read().lower()
+            except OSError:
+                continue
+            for pattern in matches:
+                if pattern.lower() in text:
+                    matches[pattern].append(path)
+        results = ["".join(path + "\n" for path in matches[pattern])
+                   for pattern in patterns]
+    else:
+        with ThreadPoolExecutor(
+                max_workers=max(1, min(max_parallel_tools, len(patterns)))
+        ) as executor:
+            results = list(executor.map(
+                lambda pattern: search_for_pattern(search_dir, pattern),
+                patterns))
+    return "\n".join(
+        f"Pattern: {pattern}\n{result}"
+        for pattern, result in zip(patterns, results))
+
 
+def _find_files(directory: str, filenames: list) -> dict:
+    """Paths of files under directory whose name contains each of filenames
 
+    All names are looked up in a single listing of the tree; each path is
+    then matched against the names case-insensitively, like find -iname.
+    Directories and hidden files are not matched.
+
+    Returns:
+        Dict mapping each filename to a list of matching paths
+    """
+    patterns = {filename: f"*{filename}*".lower() for filename in filenames}
+    if _RG_PATH:
+        # ripgrep lists the tree in parallel, skipping .gitignore'd files
+        cmd = [_RG_PATH, "--files"]
+        for pattern in patterns.values():
+            cmd += ["--iglob", pattern]
+        paths = _run_search(cmd + [directory]).splitlines()
+    else:
+        # Walk the tree in-process (os.walk uses os.scandir), which is
+        # cheaper than starting a find process for the usual small repos.
+        # As with rg --files, only files are matched and hidden files and
+        # directories (including .git) are skipped.
+        paths = []
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            paths.extend(os.path.join(root, name) for name in files
+                         if not name.startswith("."))
+    matches = {filename: [] for filename in filenames}
+    for path in paths:
+        name = os.path.basename(path).lower()
+        for filename, pattern in patterns.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                matches[filename].append(path)
+    return matches
+
+
+@tool
 def search_for_file(
         directory: str,
         filename: str,
@@ -69,16 +300,40 @@ def search_for_file(
     Returns:
         - Path to file
     """
-    run_str = f"find {directory} -iname '*{filename}*'"
-    print(run_str)
-    # out = os.system(run_str)
-    out = os.popen(run_str).read()
-    if out:
-        return out
+    try:
+        paths = _find_files(directory, [filename])[filename]
+    except _SearchError as e:
+        return str(e)
+    if paths:
+        return "".join(path + "\n" for path in paths)
     else:
         return "File not found"
 
 
+@tool
+def search_for_files(
+        directory: str,
+        filenames: list[str],
+) -> str:
+    """Search for several files in a directory at once
+    Inputs:
+        - Directory : Path to directory
+        - Filenames : Names of files
+
+    Returns:
+        - Paths to each file
+    """
+    try:
+        matches = _find_files(directory, filenames)
+    except _SearchError as e:
+        return str(e)
+    return "\n".join(
+        f"Filename: {filename}\n" +
+        ("".join(path + "\n" for path in matches[filename])
+         or "File not found\n")
+        for filename in filenames)
+
+
 def estimate_tokens(text: str) -> int:
     """Estimate the number of tokens in text by splitting on whitespace
 
@@ -93,6 +348,114 @@ def estimate_tokens(text: str) -> int:
     return len(text.split())
 
 
+def _estimate_numbered_tokens(lines) -> int:
+    """estimate_tokens of the line-numbered version of lines
+
+    Each "%04d: " prefix is exactly one token, so the lines are counted
+    one at a time instead of splitting the joined text, which would
+    build a list of every token in the file.
+    """
+    return len(lines) + sum(map(len, map(str.split, lines)))
+
+
+@functools.lru_cache(maxsize=256)
+def _load_lines(filepath: str, mtime_ns: int, size: int) -> tuple:
+    """Read (and cache) the lines of a file
+
+    mtime_ns and size are only part of the cache key, so a file that
+    changes on disk is read again.
+    """
+    with open(filepath, 'r') as file:
+        return tuple(file.readlines())
+
+
+def _number_lines(lines, start: int = 0) -> list:
+    """Prefix each line with its (zero-padded) line number"""
+    return ["%04d: %s" % (i, line) for i, line in enumerate(lines, start)]
+
+
+@functools.lru_cache(maxsize=64)
+def _load_numbered(filepath: str, mtime_ns: int, size: int) -> tuple:
+    """Line-numbered contents of a file, cached like _load_lines
+
+    Only the joined string is kept; the per-line list is rebuilt from
+    _load_lines in the (rare) case the file needs truncating.
+
+    Returns:
+        Tuple of (joined numbered contents, estimated tokens)
+    """
+    lines = _load_lines(filepath, mtime_ns, size)
+    full_content = "".join(
+        "%04d: %s" % (i, line) for i, line in enumerate(lines))
+    return full_content, _estimate_numbered_tokens(lines)
+
+
+def _truncate_lines(numbered_lines: list) -> tuple:
+    """Keep as many leading lines as fit within token_threshold
+
+    Returns:
+        Tuple of (included lines, their estimated tokens)
+    """
+    # Same count as estimate_tokens per line (numbered lines are never
+    # empty), without a Python-level call for every line
+    cumulative_tokens = list(itertools.accumulate(
+        map(len, map(str.split, numbered_lines))))
+    cutoff = bisect.bisect_right(cumulative_tokens, token_threshold)
+    current_tokens = cumulative_tokens[cutoff - 1] if cutoff else 0
+    return numbered_lines[:cutoff], current_tokens
+
+
+@functools.lru_cache(maxsize=16)
+def _load_numbered_prefix(filepath: str, mtime_ns: int, size: int) -> tuple:
+    """Line-numbered leading lines of a large file, cached like _load_lines
+
+    The file is memory-mapped and scanned line by line (as bytes) until
+    token_threshold would be exceeded. Only the kept prefix is decoded, in
+    one go, so the tail of a file that gets truncated anyway is never read
+    or decoded.
+
+    Returns:
+        Tuple of (joined numbered lines, number of lines, estimated tokens,
+        whether the file was truncated)
+    """
+    n_lines = 0
+    current_tokens = 0
+    end = 0
+    truncated = False
+    with open(filepath, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for raw_line in iter(mm.readline, b''):
+            # +1 for the line number prefix, as in _estimate_numbered_tokens
+            line_tokens = len(raw_line.split()) + 1
+            if current_tokens + line_tokens > token_threshold:
+                truncated = True
+                break
+            n_lines += 1
+            current_tokens += line_tokens
+            end += len(raw_line)
+        text = mm[:end].decode('utf-8').replace('\r\n', '\n')
+    lines = io.StringIO(text).readlines()
+    return "".join(_number_lines(lines)), n_lines, current_tokens, truncated
+
+
+@functools.lru_cache(maxsize=64)
+def _line_offsets(filepath: str, mtime_ns: int, size: int) -> list:
+    """Byte offset of the start of each line, cached like _load_lines
+
+    The last entry is the size of the file, so line i spans
+    offsets[i]:offsets[i + 1].
+    """
+    with open(filepath, 'rb') as file:
+        return list(itertools.accumulate(map(len, file), initial=0))
+
+
+def _stat_key(filepath: str) -> tuple:
+    """Cache key (absolute path, mtime, size) for a file"""
+    stat = os.stat(filepath)
+    return os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size
+
+
+@tool
 def readfile(
         filepath: str,
 ) -> str:
@@ -114,46 +477,73 @@ def readfile(
         print(content)  # Shows numbered lines
     """
     try:
-        with open(filepath, 'r') as file:
-            data = file.readlines()
+        # Files are often read again in later turns, so the numbered
+        # contents are cached until the file changes
+        stat_key = _stat_key(filepath)
+        if stat_key[2] > large_file_size:
+            data, n_included, current_tokens, truncated = \
+                _load_numbered_prefix(*stat_key)
+        else:
+            full_content, total_tokens = _load_numbered(*stat_key)
+            if total_tokens > token_threshold:
+                # Include as many lines as possible. The prefix is read with
+                # an early exit instead of numbering and counting every line
+                # of the file again.
+                data, n_included, current_tokens, _ = \
+                    _load_numbered_prefix(*stat_key)
+                n_lines = len(_load_lines(*stat_key))
     except FileNotFoundError:
         return f"File not found: {filepath}"
     except Exception as e:
         return f"Error reading file {filepath}: {str(e)}"
 
-    # Add line numbers
-    numbered_lines = [f"{i:04}: {line}" for i, line in enumerate(data)]
-
-    # Check total tokens
-    full_content = "".join(numbered_lines)
-    total_tokens = estimate_tokens(full_content)
+    if stat_key[2] > large_file_size:
+        if not truncated:
+            return data
+        # The rest of the file was not read, so its size is not known
+        warning = (f"File exceeds token threshold of {token_threshold}. "
+                   f"Showing the first {n_included} lines "
+                   f"({current_tokens} tokens). "
+                   f"Use readlines({filepath}, start_line, end_line) "
+                   f"to read specific ranges.")
+        return data + f"\n\n{warning}"
 
     if total_tokens <= token_threshold:
         return full_content
 
-    # If over threshold, include as many lines as possible
-    current_tokens = 0
-    included_lines = []
-
-    for line in numbered_lines:
-        line_tokens = estimate_tokens(line)
-        if current_tokens + line_tokens > token_threshold:
-            break
-        included_lines.append(line)
-        current_tokens += line_tokens
-
     warning = (f"File exceeds token threshold of {token_threshold}. "
-               f"Showing {len(included_lines)} of {len(data)} lines "
+               f"Showing {n_included} of {n_lines} lines "
                f"({current_tokens}/{total_tokens} tokens). "
                f"Use readlines({filepath}, start_line, end_line) "
                f"to read specific ranges.")
 
-    data = "".join(included_lines)
     data += f"\n\n{warning}"
 
     return data
 
 
+@tool
+def readfiles(
+        filepaths: list[str],
+) -> str:
+    """Read several files at once and return their contents with line numbers.
+    Each file is truncated like readfile if it exceeds the token threshold.
+
+    Args:
+        filepaths: Paths to files to read
+
+    Returns:
+        Contents of each file, preceded by its path
+    """
+    with ThreadPoolExecutor(
+            max_workers=max(1, min(max_parallel_tools, len(filepaths)))) as executor:
+        results = executor.map(readfile, filepaths)
+        return "\n".join(
+            f"File: {filepath}\n{result}"
+            for filepath, result in zip(filepaths, results))
+
+
+@tool
 def readlines(
         file_path: str,
         start_line: int,
@@ -170,32 +560,30 @@ def readlines(
     Returns:
         - Lines from file
     """
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-    lines = lines[start_line:end_line]
+    # Seek straight to the wanted lines using the (cached) line offsets
+    stat_key = _stat_key(file_path)
+    offsets = _line_offsets(*stat_key)
+    wanted = range(len(offsets) - 1)[start_line:end_line]
+    if wanted:
+        start, end = offsets[wanted.start], offsets[wanted.stop]
+        with open(file_path, 'rb') as file:
+            file.seek(start)
+            text = file.read(end - start).decode('utf-8')
+        lines = io.StringIO(text.replace('\r\n', '\n')).readlines()
+    else:
+        lines = []
 
     # Add line numbers
-    numbered_lines = [f"{i+start_line:04}: {line}" for i,
-                      line in enumerate(lines)]
+    numbered_lines = _number_lines(lines, start_line)
 
     # Check total tokens
-    full_content = "".join(numbered_lines)
-    total_tokens = estimate_tokens(full_content)
+    total_tokens = _estimate_numbered_tokens(lines)
 
     if total_tokens <= token_threshold:
-        return full_content
+        return "".join(numbered_lines)
 
     # If over threshold, include as many lines as possible
-    current_tokens = 0
-    included_lines = []
-
-    for line in numbered_lines:
-        line_tokens = estimate_tokens(line)
-        if current_tokens + line_tokens > token_threshold:
-            break
-        included_lines.append(line)
-        current_tokens += line_tokens
+    included_lines, current_tokens = _truncate_lines(numbered_lines)
 
     n_included = len(included_lines)
 
@@ -211,48 +599,92 @@ def readlines(
     return data
 
 
+@functools.lru_cache(maxsize=128)
+def _func_index(filepath: str, mtime_ns: int, size: int) -> dict:
+    """Map function names to their (start, end) line span, cached like _load_lines
+
+    Functions are indexed by name and by qualified name (Class.method).
+    The span includes decorators. When a name is defined more than once,
+    the first definition in the file is used.
+    """
+    tree = ast.parse("".join(_load_lines(filepath, mtime_ns, size)))
+    index = {}
+
+    def _visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef,
+                                  ast.ClassDef)):
+                qualname = prefix + child.name
+                if not isinstance(child, ast.ClassDef):
+                    start = min([x.lineno for x in child.decorator_list]
+                                + [child.lineno]) - 1
+                    index.setdefault(child.name, (start, child.end_lineno))
+                    index.setdefault(qualname, (start, child.end_lineno))
+                _visit(child, qualname + '.')
+            else:
+                _visit(child, prefix)
+
+    _visit(tree, '')
+    return index
+
+
+@tool
 def get_func_code(
         module_path: str,
         func_name: str,
 ) -> str:
-    """Use simple search to get the code for a function
+    """Get the code for a function
 
     Inputs:
         - module_path : Path to module
-        - func_name : Name of function
+        - func_name : Name of function (or Class.method)
 
     Returns:
         - Code for function
     """
+    # Agents often ask for the same function again in later turns
+    return _get_func_code(*_stat_key(module_path), func_name)
 
-    with open(module_path, 'r') as file:
-        lines = file.readlines()
-
-    # Find all function definitions
-    import re
-    match_pattern = re.compile(r'def\s+.*\(')
-    func_defs = re.findall(match_pattern, "\n".join(lines))
-    # Get line numbers for each function definition
-    func_def_lines = [i for i, line in enumerate(
-        lines) if match_pattern.findall(line)]
-    func_def_line_map = {func_def_lines[i]: func_defs[i]
-                         for i in range(len(func_defs))}
-
-    # Find range of lines for wanted function
-    for i, this_num in enumerate(func_def_lines):
-        if func_name in func_def_line_map[this_num]:
-            start_line = this_num
-            try:
-                end_line = func_def_lines[i+1] - 1
-            except IndexError:
-                end_line = len(lines)
+
+@functools.lru_cache(maxsize=512)
+def _get_func_code(module_path: str, mtime_ns: int, size: int,
+                   func_name: str) -> str:
+    """get_func_code, cached on the file's stat like _load_lines"""
+    stat_key = (module_path, mtime_ns, size)
+    lines = _load_lines(*stat_key)
+
+    # Exact boundaries from the (cached) syntax tree
+    try:
+        span = _func_index(*stat_key).get(func_name)
+    except SyntaxError:
+        span = None
+    if span is not None:
+        return "".join(lines[span[0]:span[1]])
+
+    # Otherwise fall back to a simple search, which also matches partial
+    # names and works on files that don't parse
+    # The function starts at the first definition matching func_name...
+    for start_line, line in enumerate(lines):
+        match = _FUNC_DEF_RE.match(line)
+        if match and func_name in match.group(0):
             break
+    else:
+        return f"Function {func_name} not found in {module_path}"
+
+    # ...and ends just before the next definition
+    for end_line in range(start_line + 1, len(lines)):
+        if _FUNC_DEF_RE.match(lines[end_line]):
+            end_line -= 1
+            break
+    else:
+        end_line = len(lines)
 
     # Get code for function
     code = "".join(lines[start_line:end_line])
     return code
 
 
+@tool
 def search_github(query: str) -> str:
     """
     Search GitHub for a given query and return code snippets.
@@ -264,7 +696,6 @@ def search_github(query: str) -> str:
         A string containing search results with code snippets.
     """
     # Import here to avoid circular imports
-    sys.path.append(src_dir)
-    from git_utils import perform_github_search
+    from src.git_utils import perform_github_search
 
     return perform_github_search(query)
@@ -2,10 +2,61 @@
 Utility functions for handling git branches related to issues
 """
 import os
+import functools
+import subprocess
 import git
 from github.Issue import Issue
 from typing import List, Optional, Tuple
 
+# Seconds to wait for external commands before giving up
+command_timeout = 60
+
+
+def _run(argv: List[str], cwd: Optional[str] = None) -> str:
+    """
+    Run a command without a shell and return its stdout
+
+    Args:
+        argv: Command and its arguments
+        cwd: Directory to run the command in
+
+    Returns:
+        Standard output of the command (failures are not raised)
+    """
+    return subprocess.run(
+        argv,
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        timeout=command_timeout,
+    ).stdout
+
+
+@functools.lru_cache(maxsize=16)
+def _open_repo(repo_path: str) -> git.Repo:
+    return git.Repo(repo_path)
+
+
+def get_git_repo(repo_path: str) -> git.Repo:
+    """
+    Get a (cached) git.Repo for a local repository
+
+    Opening a repository searches for its .git directory and sets up the
+    object database, so repositories are opened once and reused.
+
+    Args:
+        repo_path: Path to local git repository
+
+    Returns:
+        git.Repo for the repository
+    """
+    repo = _open_repo(os.path.abspath(repo_path))
+    if not os.path.isdir(repo.git_dir):
+        # The checkout was removed since it was opened
+        _open_repo.cache_clear()
+        repo = _open_repo(os.path.abspath(repo_path))
+    return repo
+
 
 def get_issue_related_branches(
         repo_path: str,
@@ -23,13 +74,12 @@ def get_issue_related_branches(
     """
     issue_number = issue.number
 
-    orig_dir = os.getcwd()
-    os.chdir(repo_path)
-
     related_branches = []
     try:
-        branches = os.popen(
-            f"gh issue develop -l {issue_number}").read().splitlines()
+        branches = _run(
+            ['gh', 'issue', 'develop', '-l', str(issue_number)],
+            cwd=repo_path,
+        ).splitlines()
         for branch in branches:
             # Each line is in the format "branch_name url"
             branch_name = branch.split('\t')[0]
@@ -42,23 +92,30 @@ def get_issue_related_branches(
 
     if len(related_branches) == 0:
 
-        repo = git.Repo(repo_path)
         issue_title_cleaned = issue.title.replace(' ', '-').lower()
         # Remove any punctuation from the title
         issue_title_cleaned = ''.join(
             char for char in issue_title_cleaned if char.isalnum() or char == '-' or char == '_')
         possible_branch_name = f"{issue.number}-{issue_title_cleaned}"
 
-        fetched_heads = repo.git.ls_remote('--heads', 'origin').splitlines()
-
-        # Check local branches
-        for branch in repo.heads:
-            if possible_branch_name in branch.name:
-                related_branches.append((branch.name, False))
-
-        for this_head in fetched_heads:
-            if possible_branch_name in this_head:
-                related_branches.append((this_head.split('heads/')[1], True))
+        # Match local and remote-tracking branches in one local query
+        ref_query = ['git', '-C', repo_path, 'for-each-ref',
+                     '--format=%(refname)',
+                     f'refs/heads/**/*{possible_branch_name}*',
+                     f'refs/remotes/origin/**/*{possible_branch_name}*']
+        refs = _run(ref_query).splitlines()
+        if not any(ref.startswith('refs/heads/') for ref in refs):
+            # Not checked out locally, so only go to the server now: fetch
+            # origin (pruning branches deleted upstream, which would
+            # otherwise still be reported) and query again
+            _run(['git', '-C', repo_path, 'fetch', '--prune', 'origin'])
+            refs = _run(ref_query).splitlines()
+        for ref in refs:
+            if ref.startswith('refs/heads/'):
+                related_branches.append((ref[len('refs/heads/'):], False))
+            else:
+                related_branches.append(
+                    (ref[len('refs/remotes/origin/'):], True))
 
         # Check remote branches
         # for remote in repo.remotes:
@@ -71,7 +128,6 @@ def get_issue_related_branches(
         #         if possible_branch_name in branch_name:
         #             related_branches.append((branch_name, True))
 
-    os.chdir(orig_dir)
     return related_branches
 
 # def get_issue_related_branches(repo_path: str, issue_number: int) -> List[Tuple[str, bool]]:
@@ -117,7 +173,7 @@ def get_current_branch(repo_path: str) -> str:
     Returns:
         Name of current branch
     """
-    repo = git.Repo(repo_path)
+    repo = get_git_repo(repo_path)
     return repo.active_branch.name
 
 
@@ -130,7 +186,7 @@ def checkout_branch(repo_path: str, branch_name: str, create: bool = False) -> N
         branch_name: Name of branch to checkout
         create: If True, create branch if it doesn't exist
     """
-    repo = git.Repo(repo_path)
+    repo = get_git_repo(repo_path)
     # Get rid of uncommited local changes
     repo.git.clean('-f')
     if create and branch_name not in repo.heads:
@@ -152,7 +208,7 @@ def delete_branch(repo_path: str, branch_name: str, force: bool = False) -> None
         branch_name: Name of branch to delete
         force: If True, force delete even if not merged
     """
-    repo = git.Repo(repo_path)
+    repo = get_git_repo(repo_path)
     if branch_name in repo.heads:
         repo.delete_head(branch_name, force=force)
 
@@ -164,7 +220,7 @@ def back_to_master_branch(repo_path: str) -> None:
     Args:
         repo_path: Path to local git repository
     """
-    repo = git.Repo(repo_path)
+    repo = get_git_repo(repo_path)
 
     # Check if master or main branch exists
     if 'master' in repo.heads:
@@ -188,7 +244,7 @@ def push_changes(repo_path: str, branch_name: Optional[str] = None, force: bool
         branch_name: Name of branch to push (defaults to current branch)
         force: If True, force push changes
     """
-    repo = git.Repo(repo_path)
+    repo = get_git_repo(repo_path)
 
     # Get current branch if none specified
     if branch_name is None:
@@ -7,10 +7,14 @@ from dotenv import load_dotenv
 from github.PullRequest import PullRequest
 from typing import List, Dict, Optional, Tuple, Union
 import os
+import time
+import functools
+import threading
 import subprocess
 import git
 import traceback
 from src.branch_handler import (
+    get_git_repo,
     get_issue_related_branches,
     get_current_branch,
     checkout_branch,
@@ -67,19 +71,35 @@ def add_signature_to_comment(comment_text: str, model: str) -> str:
     return comment_text
 
 
+@functools.lru_cache(maxsize=4)
+def _create_github_client(token: str) -> Github:
+    """One client per token, so its connection pool is reused"""
+    # Larger pages mean fewer requests when listing comments and issues
+    return Github(token, per_page=100)
+
+
 def get_github_client() -> Github:
-    """Initialize and return authenticated GitHub client"""
+    """Initialize and return authenticated GitHub client
+
+    The client is created once per token and shared by all callers.
+    """
     load_dotenv()
     token = os.getenv('GITHUB_TOKEN')
     if not token:
         raise ValueError("GitHub token not found in environment variables")
-    return Github(token)
+    return _create_github_client(token)
+
+
+@functools.lru_cache(maxsize=64)
+def _get_repo(client: Github, repo_name: str) -> Repository:
+    """Fetch (and cache) a repository for a client"""
+    return client.get_repo(repo_name)
 
 
 def get_repository(client: Github, repo_name: str) -> Repository:
     """Get repository object by full name (owner/repo)"""
     try:
-        return client.get_repo(repo_name)
+        return _get_repo(client, repo_name)
     except Exception as e:
         raise ValueError(f"Could not access repository {repo_name}: {str(e)}")
 
@@ -90,8 +110,56 @@ def get_open_issues(repo: Repository) -> List[Issue]:
     return list(repo.get_issues(state='open', sort='created', direction='asc'))
 
 
+# Short-lived caches of GitHub API responses, so the triggers and prompt
+# builders working on the same issue share a single request.
+# Entries map a key to (time fetched, value).
+api_cache_ttl = 60
+api_cache_maxsize = 512
+_comment_cache = {}
+_pull_cache = {}
+# The caches are used from several threads (e.g. the comment prefetch and
+# the linked PR lookups), so all access goes through this lock
+_api_cache_lock = threading.Lock()
+
+
+def _cache_get(cache: dict, key):
+    """Return the cached value for key, or None if missing or expired"""
+    with _api_cache_lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > api_cache_ttl:
+            del cache[key]
+            return None
+        return entry[1]
+
+
+def _cache_set(cache: dict, key, value) -> None:
+    """Store value under key, evicting the oldest entry when full"""
+    with _api_cache_lock:
+        if key not in cache and len(cache) >= api_cache_maxsize:
+            del cache[next(iter(cache))]
+        cache[key] = (time.monotonic(), value)
+
+
+def invalidate_comment_cache(issue: Union[Issue, PullRequest]) -> None:
+    """Drop cached comments for an issue or PR (e.g. after commenting on it)"""
+    with _api_cache_lock:
+        for key in [x for x in _comment_cache if x[0] == issue.url]:
+            del _comment_cache[key]
+
+
 def get_issue_comments(issue: Issue) -> List[IssueComment]:
-    """Get all comments for a specific issue or pull request, ignoring Graphite-related comments"""
+    """Get all comments for a specific issue or pull request, ignoring Graphite-related comments
+
+    Results are cached for api_cache_ttl seconds, keyed on the issue's
+    updated_at so edits to the issue are picked up.
+    """
+    cache_key = (issue.url, issue.updated_at)
+    cached = _cache_get(_comment_cache, cache_key)
+    if cached is not None:
+        return list(cached)
+
     # Text to identify Graphite-related comments
     # ignore_text = "This stack of pull requests is managed by"
     ignore_text = "app.graphite.dev"
@@ -113,15 +181,37 @@ def get_issue_comments(issue: Issue) -> List[IssueComment]:
         if ignore_text not in comment_body
     ]
 
+    _cache_set(_comment_cache, cache_key, filtered_comments)
     return list(filtered_comments)
 
 
+def get_pull_request(repo: Repository, pr_number: int) -> PullRequest:
+    """Get a pull request by number, cached for api_cache_ttl seconds"""
+    cache_key = (repo.full_name, pr_number)
+    pr = _cache_get(_pull_cache, cache_key)
+    if pr is None:
+        pr = repo.get_pull(pr_number)
+        _cache_set(_pull_cache, cache_key, pr)
+    return pr
+
+
+# Pull request URLs, e.g. https://github.com/owner/repo/pull/123
+_PR_URL_RE = re.compile(r'/pull/(\d+)')
+
+
+def get_pr_numbers(text: str) -> List[int]:
+    """Get the numbers of all pull requests linked in text, in order"""
+    return list(dict.fromkeys(int(x) for x in _PR_URL_RE.findall(text or "")))
+
+
 def create_issue_comment(
         issue: Issue,
         comment_text: str,
 ) -> IssueComment:
     """Create a new comment on an issue"""
-    return issue.create_comment(comment_text)
+    comment = issue.create_comment(comment_text)
+    invalidate_comment_cache(issue)
+    return comment
 
 
 def get_issue_details(issue: Issue) -> Dict:
@@ -235,13 +325,31 @@ def update_repository(repo_path: str) -> None:
     Args:
         repo_path: Path to local git repository
     """
-    import git
-
-    git_repo = git.Repo(repo_path)
+    git_repo = get_git_repo(repo_path)
     origin = git_repo.remotes.origin
     origin.pull()
 
 
+def get_current_commit(repo_path: str) -> str:
+    """
+    Get the hash of the commit checked out in a local repository
+
+    Args:
+        repo_path: Path to local git repository
+
+    Returns:
+        Full hash of HEAD
+    """
+    # A single rev-parse is much cheaper than setting up a git.Repo
+    result = subprocess.run(
+        ['git', '-C', repo_path, 'rev-parse', 'HEAD'],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip()
+
+
 def get_pr_branch(pr: PullRequest) -> str:
     """
     Get the branch name for a pull request
@@ -322,13 +430,10 @@ def get_development_branch(issue: Issue, repo_path: str, create: bool = False) -
 
         if create:
             try:
-                # Change to repo directory
-                original_dir = os.getcwd()
-                os.chdir(repo_path)
-
                 # Create branch from issue
                 result = subprocess.run(
                     ['gh', 'issue', 'develop', str(issue.number)],
+                    cwd=repo_path,
                     check=True,
                     capture_output=True,
                     text=True
@@ -337,9 +442,6 @@ def get_development_branch(issue: Issue, repo_path: str, create: bool = False) -
                 related_branch = get_issue_related_branches(
                     repo_path, issue)
 
-                # Return to original directory
-                os.chdir(original_dir)
-
                 print(f"Created branch: {related_branch[0][0]}")
                 return related_branch[0][0]
 
@@ -357,10 +459,6 @@ def get_development_branch(issue: Issue, repo_path: str, create: bool = False) -
                 if len(comments) == 0 or error_msg not in comments[-1].body:
                     write_issue_response(issue, error_msg_with_signature)
 
-                # Make sure to return to original directory before raising exception
-                if 'original_dir' in locals():
-                    os.chdir(original_dir)
-
                 raise ValueError(error_msg)
             except subprocess.CalledProcessError as e:
                 error_msg = f"Failed to create development branch: {e.stderr.strip()}"
@@ -376,10 +474,6 @@ def get_development_branch(issue: Issue, repo_path: str, create: bool = False) -
                 if len(comments) == 0 or "Failed to create" not in comments[-1].body:
                     write_issue_response(issue, error_msg_with_signature)
 
-                # Make sure to return to original directory before raising exception
-                if 'original_dir' in locals():
-                    os.chdir(original_dir)
-
                 raise RuntimeError(error_msg)
             except Exception as e:
                 error_msg = f"Unexpected error creating development branch: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
@@ -393,10 +487,6 @@ def get_development_branch(issue: Issue, repo_path: str, create: bool = False) -
 
                 write_issue_response(issue, error_msg_with_signature)
 
-                # Make sure to return to original directory before raising exception
-                if 'original_dir' in locals():
-                    os.chdir(original_dir)
-
                 raise RuntimeError(error_msg)
 
     except Exception as e:
@@ -429,19 +519,13 @@ def create_pull_request(repo_path: str) -> str:
         ValueError: If gh CLI is not installed
     """
     try:
-        # Change to repo directory
-        original_dir = os.getcwd()
-        os.chdir(repo_path)
-
         # Create pull request
         result = subprocess.run(['gh', 'pr', 'create', '--fill'],
+                                cwd=repo_path,
                                 check=True,
                                 capture_output=True,
                                 text=True)
 
-        # Return to original directory
-        os.chdir(original_dir)
-
         # Return the PR URL from the output
         return result.stdout.strip()
 
@@ -485,7 +569,7 @@ def push_changes_with_authentication(
     if not token:
         raise ValueError("GitHub token not found in environment variables")
 
-    repo = git.Repo(repo_path)
+    repo = get_git_repo(repo_path)
     if branch_name is None:
         branch_name = repo.active_branch.name
 
@@ -531,7 +615,6 @@ def update_self_repo(
     """
     import git
     import os
-    import shutil
 
     git_repo = git.Repo(repo_path)
     origin = git_repo.remotes.origin
@@ -548,15 +631,15 @@ def update_self_repo(
 
     print(f"Updating self-repo {repo_name}...")
 
-    # Backup config/repos.txt
+    # Backup config/repos.txt in memory, it is small and only needs to
+    # survive the reset below
     config_repos_path = os.path.join(repo_path, 'config', 'repos.txt')
-    backup_path = os.path.join(repo_path, 'config', 'repos.txt.backup')
 
-    has_backup = False
+    repos_backup = None
     if os.path.exists(config_repos_path):
         print(f"Backing up {config_repos_path}")
-        shutil.copy2(config_repos_path, backup_path)
-        has_backup = True
+        with open(config_repos_path, 'rb') as f:
+            repos_backup = f.read()
 
     # Fetch latest changes
     print("Fetching latest changes for self-repo")
@@ -596,10 +679,14 @@ def update_self_repo(
             f"Self-repo is up-to-date. Current commit: {local_commit.hexsha[:7]}")
 
     # Restore config/repos.txt
-    if has_backup:
+    if repos_backup is not None:
         print(f"Restoring {config_repos_path}")
-        shutil.copy2(backup_path, config_repos_path)
-        os.remove(backup_path)
+        # Write a temporary file and rename it over the original, so
+        # repos.txt is never left half-written
+        tmp_path = config_repos_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(repos_backup)
+        os.replace(tmp_path, config_repos_path)
 
     return update_performed
 
@@ -658,24 +745,35 @@ def perform_github_search(
         return f"Error performing GitHub search: {str(e)}"
 
 
-def has_linked_pr(issue: Issue) -> bool:
+def _find_linked_pr_event(issue: Issue):
     """
-    Check if an issue has a linked pull request
+    Find the first timeline event cross-referencing a pull request
+
+    The timeline is paginated, so it is iterated lazily and only the pages
+    up to the first matching event are fetched.
+
     Args:
         issue: The GitHub issue to check
     Returns:
-        True if the issue has a linked PR, False otherwise
+        The timeline event, or None if there is none
     """
-    # Get timeline events to check for PR links
-    timeline = list(issue.get_timeline())
-
-    # Check if any timeline event is a cross-reference to a PR
-    for event in timeline:
+    for event in issue.get_timeline():
         if event.event == "cross-referenced":
             # Check if the reference is to a PR
             if event.source and event.source.type == "PullRequest":
-                return True
-    return False
+                return event
+    return None
+
+
+def has_linked_pr(issue: Issue) -> bool:
+    """
+    Check if an issue has a linked pull request
+    Args:
+        issue: The GitHub issue to check
+    Returns:
+        True if the issue has a linked PR, False otherwise
+    """
+    return _find_linked_pr_event(issue) is not None
 
 
 def get_linked_pr(issue: Issue) -> Optional[PullRequest]:
@@ -686,20 +784,10 @@ def get_linked_pr(issue: Issue) -> Optional[PullRequest]:
     Returns:
         The linked PullRequest object or None if not found
     """
-    # Get timeline events to check for PR links
-    timeline = list(issue.get_timeline())
-
-    # Check if any timeline event is a cross-reference to a PR
-    for event in timeline:
-        if event.event == "cross-referenced":
-            # Check if the reference is to a PR
-            if event.source and event.source.type == "PullRequest":
-                pr_number = event.source.issue.number
-                repo = issue.repository
-                return repo.get_pull(pr_number)
-
-    return None
-
+    event = _find_linked_pr_event(issue)
+    if event is None:
+        return None
+    return issue.repository.get_pull(event.source.issue.number)
 
 if __name__ == '__main__':
     client = get_github_client()
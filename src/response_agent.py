@@ -6,31 +6,50 @@ Agent for generating responses to GitHub issues using pyautogen
     2. Skip: Skipped because triggers were not met (e.g., no bot tag, already responded)
     3. Error: An error occurred during processing (e.g., exception thrown)
 """
-from typing import Optional, Tuple, List, Union
-
-from dotenv import load_dotenv
+import os
+import sys
+import re
+import json
 import string
-import triggers
+import hashlib
+import asyncio
+import functools
+import threading
 import traceback
-from src.agents import (
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pprint import pprint
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Optional, Tuple, List, Union
+
+from dotenv import load_dotenv
+from github.Repository import Repository
+from github.Issue import Issue
+from github.PullRequest import PullRequest
+
+# Make the src package importable when run as `python src/response_agent.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import triggers  # noqa: E402
+from src import bot_tools  # noqa: E402
+from src.agents import (  # noqa: E402
     create_user_agent,
     create_agent,
+    release_agents,
     generate_prompt,
-    parse_comments
+    parse_comments,
+    parse_comment_summaries,
+    generate_codeact_answer_prompt,
+    run_codeact_program,
+    get_url_previews,
 )
-from urlextract import URLExtract
-import agents
-from autogen import AssistantAgent
-import bot_tools
-import os
-
-from src.git_utils import (
+from src.git_utils import (  # noqa: E402
     get_github_client,
     get_repository,
     write_issue_response,
     get_issue_details,
     clone_repository,
     update_repository,
+    get_current_commit,
     get_issue_comments,
     create_pull_request_from_issue,
     get_development_branch,
@@ -38,28 +57,18 @@ from src.git_utils import (
     is_pull_request,
     get_pr_branch,
     add_signature_to_comment,
+    invalidate_comment_cache,
+    get_pr_numbers,
 )
-from github.Repository import Repository
-from github.Issue import Issue
-from github.PullRequest import PullRequest
-from src.branch_handler import (
+from src.branch_handler import (  # noqa: E402
     checkout_branch,
     back_to_master_branch,
     delete_branch
 )
-import autogen
-import subprocess
-import os
-from pprint import pprint
-from collections.abc import Callable
-import random
-import traceback
-import json
-import re
-from urlextract import URLExtract
-import requests
-import bs4
-import git
+
+# Only needed for URL handling, so imported when first used
+if TYPE_CHECKING:
+    from urlextract import URLExtract
 
 load_dotenv()
 src_dir = os.path.dirname(os.path.abspath(__file__))
@@ -76,7 +85,9 @@ if not api_key:
 llm_config = {
     "model": params.get("model", "gpt-4o"),
     "api_key": api_key,
-    "temperature": random.uniform(0, 0.2),
+    # Fixed temperature so identical prompts produce identical requests
+    # (lets OpenAI prompt caching and autogen's response cache hit)
+    "temperature": params.get("temperature", 0.02),
 }
 ############################################################
 # Response patterns
@@ -84,9 +95,6 @@ llm_config = {
 
 
 def tab_print(x):
-    """
-    Print with tab indentation for readability
-    """
     """
     Print with tab indentation for readability
     :param x: The object to print
@@ -102,17 +110,28 @@ def tab_print(x):
         print('\t' + str(x))
 
 
-def extract_urls_from_issue(issue: Issue) -> List[str]:
+@functools.lru_cache(maxsize=None)
+def get_url_extractor() -> "URLExtract":
+    """URLExtract loads its TLD list on creation, so build it once"""
+    from urlextract import URLExtract
+    return URLExtract()
+
+
+def extract_urls_from_issue(
+        issue: Issue,
+        comments: Optional[list] = None,
+) -> List[str]:
     """
     Extract URLs from issue body and comments
 
     Args:
         issue: The GitHub issue to extract URLs from
+        comments: The issue's comments, if the caller already fetched them
 
     Returns:
         List of URLs found in the issue
     """
-    extractor = URLExtract()
+    extractor = get_url_extractor()
     urls = []
 
     # Extract from issue body
@@ -120,7 +139,9 @@ def extract_urls_from_issue(issue: Issue) -> List[str]:
     urls.extend(extractor.find_urls(issue_body))
 
     # Extract from comments
-    for comment in get_issue_comments(issue):
+    if comments is None:
+        comments = get_issue_comments(issue)
+    for comment in comments:
         comment_body = comment.body or ""
         urls.extend(extractor.find_urls(comment_body))
 
@@ -133,6 +154,79 @@ def extract_urls_from_issue(issue: Issue) -> List[str]:
     return unique_urls
 
 
+# Pages are read up to this many bytes; anything after is ignored
+max_page_bytes = 5 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def get_html_parser() -> str:
+    """
+    Pick the BeautifulSoup parser, preferring the C-based lxml if installed
+
+    Returns:
+        Name of the parser to pass to BeautifulSoup
+    """
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+
+# Scraped page text is kept here with the page's ETag/Last-Modified, so
+# later runs only download pages that have changed
+url_cache_dir = os.path.join(base_dir, '.url_cache')
+
+
+def _url_cache_path(url: str) -> str:
+    digest = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    return os.path.join(url_cache_dir, digest + '.json')
+
+
+def load_cached_page(url: str) -> Optional[dict]:
+    """
+    Get the cached text and validators for a URL
+
+    Args:
+        url: The URL that was scraped
+
+    Returns:
+        Dict with 'etag', 'last_modified' and 'text', or None if not cached
+    """
+    try:
+        with open(_url_cache_path(url)) as f:
+            entry = json.load(f)
+        if entry.get('url') == url:
+            return entry
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def store_cached_page(url: str, etag: Optional[str],
+                      last_modified: Optional[str], text: str) -> None:
+    """
+    Cache the scraped text of a URL along with its validators
+
+    Args:
+        url: The URL that was scraped
+        etag: ETag header of the response
+        last_modified: Last-Modified header of the response
+        text: Scraped text
+    """
+    path = _url_cache_path(url)
+    try:
+        os.makedirs(url_cache_dir, exist_ok=True)
+        # Write then rename, so concurrent scrapes never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'url': url, 'etag': etag,
+                       'last_modified': last_modified, 'text': text}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        tab_print(f"Could not cache URL {url}: {e}")
+
+
 def scrape_text_from_url(url: str) -> str:
     """Scrape text content from a given URL.
 
@@ -142,16 +236,48 @@ def scrape_text_from_url(url: str) -> str:
     Returns:
         The scraped text content or a message if non-text content is detected.
     """
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()  # Raise an error for bad responses
+    import requests
+    import bs4
+
+    # Revalidate a previously scraped page instead of downloading it again
+    cached = load_cached_page(url)
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
 
-        # Check if the content type is text-based
-        content_type = response.headers.get('Content-Type', '')
-        if 'text' not in content_type and 'html' not in content_type and 'json' not in content_type:
-            return f"Non-text content detected at URL {url}: {content_type}"
+    try:
+        # Stream the body so the content type can be checked before it is
+        # downloaded, and so very large pages are cut off at max_page_bytes
+        with requests.get(url, timeout=10, stream=True,
+                          headers=headers) as response:
+            if cached and response.status_code == 304:
+                return cached['text']
+            response.raise_for_status()  # Raise an error for bad responses
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+            # Check if the content type is text-based
+            content_type = response.headers.get('Content-Type', '')
+            if 'text' not in content_type and 'html' not in content_type and 'json' not in content_type:
+                return f"Non-text content detected at URL {url}: {content_type}"
+
+            content = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                content += chunk
+                if len(content) >= max_page_bytes:
+                    break
+            try:
+                html = content[:max_page_bytes].decode(
+                    response.encoding or 'utf-8', errors='replace')
+            except LookupError:
+                # Unknown charset in the Content-Type header
+                html = content[:max_page_bytes].decode(
+                    'utf-8', errors='replace')
 
-        soup = bs4.BeautifulSoup(response.text, 'html.parser')
+        soup = bs4.BeautifulSoup(html, get_html_parser())
 
         # Remove script and style elements
         for script in soup(["script", "style"]):
@@ -168,6 +294,9 @@ def scrape_text_from_url(url: str) -> str:
         # Remove blank lines
         text = '\n'.join(chunk for chunk in chunks if chunk)
 
+        if etag or last_modified:
+            store_cached_page(url, etag, last_modified, text)
+
         return text
     except requests.RequestException as e:
         tab_print(f"Error fetching URL {url}: {e}")
@@ -200,20 +329,103 @@ def summarize_text(text: str, max_length: int = 1000) -> str:
     {text}
     """
 
-    # Get summary from the agent
-    summary_results = summary_agent.initiate_chat(
-        summary_agent,
-        message=summary_prompt,
-        max_turns=1,
-        silent=params['print_llm_output']
-    )
+    # Get summary from the agent. Passing the messages explicitly keeps the
+    # agent's chat history untouched
+    try:
+        summary = summary_agent.generate_reply(
+            messages=[{"role": "user", "content": summary_prompt}])
+    finally:
+        release_agents(summary_agent)
 
     # Extract the summary from the response
-    summary = summary_results.chat_history[-1]['content']
+    if isinstance(summary, dict):
+        summary = summary.get('content')
+    if not summary:
+        summary = text[:max_length]
 
     return summary
 
 
+def fetch_url_contents(urls: List[str]) -> dict:
+    """Scrape and summarize the content of several URLs concurrently.
+
+    Each URL is independent, so the network fetches and summary LLM calls
+    are overlapped instead of run one after another.
+
+    Args:
+        urls: The URLs to fetch.
+
+    Returns:
+        Dict mapping each URL to its (summarized) content.
+    """
+    async def _fetch_all():
+        semaphore = asyncio.Semaphore(params.get('max_concurrent_requests', 4))
+
+        async def _fetch(url):
+            async with semaphore:
+                tab_print(f"Scraping content from {url}")
+                content = await asyncio.to_thread(scrape_text_from_url, url)
+                # Summarize content to avoid token limits
+                return await asyncio.to_thread(summarize_text, content)
+
+        return await asyncio.gather(*[_fetch(url) for url in urls])
+
+    return dict(zip(urls, asyncio.run(_fetch_all())))
+
+
+def collect_issue_context(
+        issue: Issue,
+        repo_name: str,
+        repo_path: str,
+        details: dict,
+        prefetch_comments: bool = True,
+) -> None:
+    """Add scraped URL contents (and parsed comments) to the issue details.
+
+    The issue comments are fetched once and used both for finding URLs and
+    for the prompts. Scraping and summarizing URLs is slow, so the comments
+    of linked PRs are fetched and parsed in the background at the same time,
+    and the result is stored in the details for generate_prompt.
+
+    Args:
+        issue: The GitHub issue being processed.
+        repo_name: Full name of repository (owner/repo).
+        repo_path: Path to the local repository.
+        details: Issue details, updated in place with 'url_contents',
+            'url_previews' and (if prefetch_comments) 'parsed_comments'.
+        prefetch_comments: Whether to parse comments in the background.
+    """
+    comments = get_issue_comments(issue)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        if prefetch_comments:
+            parsed_future = executor.submit(
+                parse_comments, repo_name, repo_path, details, issue)
+
+        # Extract URLs from issue and scrape content
+        urls = extract_urls_from_issue(issue, comments)
+        if urls:
+            tab_print(f"Found {len(urls)} URLs in issue")
+            details['url_contents'] = fetch_url_contents(urls)
+            # Truncated once here instead of for every prompt
+            details['url_previews'] = get_url_previews(details['url_contents'])
+
+        if prefetch_comments:
+            # Raises any error from parsing the comments
+            details['parsed_comments'] = parsed_future.result()
+
+
+@functools.lru_cache(maxsize=4)
+def _load_tracked_repos(tracked_repos_path: str, mtime_ns: int) -> tuple:
+    """Read the tracked repositories file
+
+    mtime_ns is only part of the cache key, so edits to the file are
+    picked up. Blank lines are skipped.
+    """
+    with open(tracked_repos_path, 'r') as file:
+        tracked_repos = file.read().splitlines()
+    return tuple(repo.strip() for repo in tracked_repos if repo.strip())
+
+
 def get_tracked_repos() -> str:
     """
     Get the tracked repositories
@@ -222,30 +434,34 @@ def get_tracked_repos() -> str:
         - List of tracked repositories
     """
     tracked_repos_path = os.path.join(base_dir, 'config', 'repos.txt')
-    with open(tracked_repos_path, 'r') as file:
-        tracked_repos = file.readlines()
-    tracked_repos = [repo.strip() for repo in tracked_repos]
-    return tracked_repos
+    mtime_ns = os.stat(tracked_repos_path).st_mtime_ns
+    return list(_load_tracked_repos(tracked_repos_path, mtime_ns))
 
 # Keep everything but tool calls
 
 
 def is_tool_related(
         x: dict,) -> bool:
-    if 'tool_calls' in x.keys() or x['role'] == 'tool':
-        return True
+    return 'tool_calls' in x or x.get('role') == 'tool'
+
+
+# Matches text that is empty or just "TERMINATE" once punctuation is ignored.
+# The match stops at the first other character, so real content is rejected
+# without copying the whole message.
+_PUNCT = '[' + re.escape(string.punctuation) + ']*'
+_EMPTY_OR_TERMINATE_RE = re.compile(
+    _PUNCT + '(?:' + _PUNCT.join('terminate') + _PUNCT + ')?',
+    flags=re.IGNORECASE,
+)
 
 
 def check_not_empty(data: str) -> bool:
     """
     Check that given data is not empty and is not a TERMINATE message
     """
-    clean_data = data.translate(str.maketrans('', '', string.punctuation))
-    clean_data = clean_data.lower()
-    if clean_data != '' and clean_data != 'terminate':
-        return True
-    else:
+    if not data:
         return False
+    return _EMPTY_OR_TERMINATE_RE.fullmatch(data) is None
 
 
 def clean_response(response: str) -> str:
@@ -272,6 +488,57 @@ def clean_response(response: str) -> str:
     return response.strip()
 
 
+def finalize_response(response: str) -> str:
+    """
+    Clean a generated response and append the model signature
+
+    Args:
+        response: The generated response text
+
+    Returns:
+        Cleaned response text ending with the blech_bot model signature
+    """
+    # Clean the response first to remove any existing signatures
+    response = clean_response(response)
+    signature = f"\n\n---\n*This response was automatically generated by blech_bot using model {llm_config['model']}*"
+    if signature not in response:
+        response += signature
+    return response
+
+
+async def summarize_comments(summary_prompts: List[str]) -> List[str]:
+    """Get the comment_summary_assistant reply for several prompts concurrently
+
+    Each call checks out its own agent, so concurrent calls never share an
+    agent's reply state or client.
+
+    Args:
+        summary_prompts: One prompt per batch of comments
+
+    Returns:
+        Reply text for each prompt, in the same order
+    """
+    semaphore = asyncio.Semaphore(params.get('max_concurrent_requests', 4))
+
+    def _generate_reply(summary_prompt):
+        comment_summary_assistant = create_agent(
+            "comment_summary_assistant", llm_config)
+        try:
+            return comment_summary_assistant.generate_reply(
+                messages=[{"role": "user", "content": summary_prompt}])
+        finally:
+            release_agents(comment_summary_assistant)
+
+    async def _summarize(summary_prompt):
+        async with semaphore:
+            reply = await asyncio.to_thread(_generate_reply, summary_prompt)
+        if isinstance(reply, dict):
+            reply = reply.get('content')
+        return reply or ""
+
+    return await asyncio.gather(*[_summarize(x) for x in summary_prompts])
+
+
 def summarize_relevant_comments(
         issue: Issue,
         repo_name: str,
@@ -300,29 +567,28 @@ def summarize_relevant_comments(
         "issue": issue,
     }
 
-    comment_summary_assistant = create_agent(
-        "comment_summary_assistant", llm_config)
-    summarized_comments = []
-    for comment in comment_list[:-1]:
-        summary_prompt = generate_prompt(
+    # Summarize comments in batches so each LLM call covers several comments
+    batch_size = params.get('comment_summary_batch_size', 8)
+    comments_to_summarize = comment_list[:-1]
+    batches = [comments_to_summarize[start:start + batch_size]
+               for start in range(0, len(comments_to_summarize), batch_size)]
+    summary_prompts = [
+        generate_prompt(
             "comment_summary_assistant",
             **prompt_kwargs,
             # original_response=comment_list[-1],
             feedback_text=comment_list[-1],
-            results_to_summarize=[comment],
-        )
-
-        chat_config = dict(
-            recipient=comment_summary_assistant,
-            message=summary_prompt,
-            max_turns=1,
-            silent=params['print_llm_output']
+            results_to_summarize=batch,
         )
-        comment_summary_results = comment_summary_assistant.initiate_chat(
-            **chat_config)
+        for batch in batches
+    ]
 
-        response = comment_summary_results.chat_history[-1]['content']
-        summarized_comments.append(response)
+    # The batches are independent, so their LLM calls run concurrently
+    responses = asyncio.run(summarize_comments(summary_prompts))
+    summarized_comments = []
+    for batch, response in zip(batches, responses):
+        summarized_comments.extend(
+            parse_comment_summaries(response, len(batch)))
 
     # Remove all mentioned of "IS_RELEVANT", "NOT_RELEVANT", and "TERMINATE" from the summaries
     # Keep them in the code for future reference
@@ -364,21 +630,9 @@ def generate_feedback_response(
     repo_path = bot_tools.get_local_repo_path(repo_name)
     details = get_issue_details(issue)
 
-    # Extract URLs from issue and scrape content
-    urls = extract_urls_from_issue(issue)
-    url_contents = {}
-
-    if urls:
-        tab_print(f"Found {len(urls)} URLs in issue")
-        for url in urls:
-            tab_print(f"Scraping content from {url}")
-            content = scrape_text_from_url(url)
-            # Summarize content to avoid token limits
-            summarized_content = summarize_text(content)
-            url_contents[url] = summarized_content
-
-        # Add URL contents to issue details
-        details['url_contents'] = url_contents
+    # Add URL contents to issue details
+    collect_issue_context(issue, repo_name, repo_path,
+                          details, prefetch_comments=False)
 
     prompt_kwargs = {
         "repo_name": repo_name,
@@ -386,9 +640,6 @@ def generate_feedback_response(
         "details": details,
         "issue": issue,
     }
-    user = create_user_agent()
-    feedback_assistant = create_agent("feedback_assistant", llm_config)
-
     comments = get_issue_comments(issue)
     for comment in reversed(comments):
         if "generated by blech_bot" not in comment.body:
@@ -406,6 +657,8 @@ def generate_feedback_response(
         feedback_text=feedback_text,
     )
 
+    user = create_user_agent()
+    feedback_assistant = create_agent("feedback_assistant", llm_config)
     chat_config = dict(
         recipient=feedback_assistant,
         message=feedback_prompt,
@@ -413,7 +666,10 @@ def generate_feedback_response(
         summary_method="reflection_with_llm",
         silent=params['print_llm_output']
     )
-    feedback_results = user.initiate_chats([chat_config])
+    try:
+        feedback_results = user.initiate_chats([chat_config])
+    finally:
+        release_agents(user, feedback_assistant)
 
     for this_chat in feedback_results[0].chat_history[::-1]:
         this_content = this_chat['content']
@@ -421,14 +677,61 @@ def generate_feedback_response(
             updated_response = this_content
             break
     all_content = [original_response, feedback_text, updated_response]
-    # Clean the response first to remove any existing signatures
-    updated_response = clean_response(updated_response)
-    signature = f"\n\n---\n*This response was automatically generated by blech_bot using model {llm_config['model']}*"
-    if signature not in updated_response:
-        updated_response += signature
+    updated_response = finalize_response(updated_response)
     return updated_response, all_content
 
 
+def generate_codeact_response(
+        issue: Issue,
+        repo_name: str,
+        repo_path: str,
+        details: dict,
+) -> Tuple[str, list]:
+    """
+    Generate a response with a single CodeAct program instead of the
+    file_assistant -> edit_assistant -> summary_assistant chats
+
+    The model writes one Python program calling the bot tools, which is run
+    locally, and then answers from the program's output.
+
+    Args:
+        issue: The GitHub issue to respond to
+        repo_name: Full name of repository (owner/repo)
+        repo_path: Path to the local repository
+        details: Issue details (including URL contents)
+
+    Returns:
+        Tuple of (response text, conversation history)
+    """
+    program_prompt = generate_prompt(
+        "codeact_assistant", repo_name, repo_path, details, issue)
+
+    codeact_assistant = create_agent("codeact_assistant", llm_config)
+    try:
+        messages = [{"role": "user", "content": program_prompt}]
+        program_reply = codeact_assistant.generate_reply(messages=messages)
+        if isinstance(program_reply, dict):
+            program_reply = program_reply.get('content')
+        program_reply = program_reply or ""
+        program_output = run_codeact_program(program_reply)
+
+        messages += [
+            {"role": "assistant", "content": program_reply},
+            {"role": "user", "content": generate_codeact_answer_prompt(program_output)},
+        ]
+        response = codeact_assistant.generate_reply(messages=messages)
+    finally:
+        release_agents(codeact_assistant)
+    if isinstance(response, dict):
+        response = response.get('content')
+    if not check_not_empty(response or ""):
+        raise ValueError("Got no response from codeact_assistant")
+
+    all_content = [program_reply, program_output, response]
+    response = finalize_response(response)
+    return response, all_content
+
+
 def generate_new_response(
         issue: Issue,
         repo_name: str,
@@ -450,28 +753,11 @@ def generate_new_response(
     repo_path = bot_tools.get_local_repo_path(repo_name)
     details = get_issue_details(issue)
 
-    # Extract URLs from issue and scrape content
-    urls = extract_urls_from_issue(issue)
-    url_contents = {}
-
-    if urls:
-        tab_print(f"Found {len(urls)} URLs in issue")
-        for url in urls:
-            tab_print(f"Scraping content from {url}")
-            content = scrape_text_from_url(url)
-            # Summarize content to avoid token limits
-            summarized_content = summarize_text(content)
-            url_contents[url] = summarized_content
+    # Add URL contents to issue details
+    collect_issue_context(issue, repo_name, repo_path, details)
 
-        # Add URL contents to issue details
-        details['url_contents'] = url_contents
-
-    # Create base agents
-    user = create_user_agent()
-    file_assistant = create_agent("file_assistant", llm_config)
-    edit_assistant = create_agent("edit_assistant", llm_config)
-    summary_assistant = create_agent("summary_assistant", llm_config)
-    # user, file_assistant, edit_assistant = create_agents()
+    if params.get('use_codeact', False):
+        return generate_codeact_response(issue, repo_name, repo_path, details)
 
     # Get prompts and run agents
     prompt_kwargs = {
@@ -483,6 +769,12 @@ def generate_new_response(
     file_prompt = generate_prompt("file_assistant", **prompt_kwargs)
     edit_prompt = generate_prompt("edit_assistant", **prompt_kwargs)
 
+    # Create base agents
+    user = create_user_agent()
+    file_assistant = create_agent("file_assistant", llm_config)
+    edit_assistant = create_agent("edit_assistant", llm_config)
+    # user, file_assistant, edit_assistant = create_agents()
+
     chat_configs = [
         dict(
             recipient=file_assistant,
@@ -500,7 +792,10 @@ def generate_new_response(
         ),
     ]
 
-    chat_results = user.initiate_chats(chat_configs)
+    try:
+        chat_results = user.initiate_chats(chat_configs)
+    finally:
+        release_agents(user, file_assistant, edit_assistant)
 
     results_to_summarize = [
         [x for x in this_result.chat_history if not is_tool_related(
@@ -521,21 +816,21 @@ def generate_new_response(
         results_to_summarize=results_to_summarize,
     )
 
-    summary_results = summary_assistant.initiate_chat(
-        summary_assistant,
-        message=summary_prompt,
-        max_turns=1,
-        silent=params['print_llm_output']
-    )
+    summary_assistant = create_agent("summary_assistant", llm_config)
+    try:
+        summary_results = summary_assistant.initiate_chat(
+            summary_assistant,
+            message=summary_prompt,
+            max_turns=1,
+            silent=params['print_llm_output']
+        )
+    finally:
+        release_agents(summary_assistant)
 
     response = summary_results.chat_history[-1]['content']
     all_content = results_to_summarize + [response]
 
-    # Clean the response first to remove any existing signatures
-    response = clean_response(response)
-    signature = f"\n\n---\n*This response was automatically generated by blech_bot using model {llm_config['model']}*"
-    if signature not in response:
-        response += signature
+    response = finalize_response(response)
     return response, all_content
 
 
@@ -562,25 +857,9 @@ def generate_edit_command_response(
     repo_path = bot_tools.get_local_repo_path(repo_name)
     details = get_issue_details(issue)
 
-    # Extract URLs from issue and scrape content
-    urls = extract_urls_from_issue(issue)
-    url_contents = {}
+    # Add URL contents to issue details
+    collect_issue_context(issue, repo_name, repo_path, details)
 
-    if urls:
-        tab_print(f"Found {len(urls)} URLs in issue")
-        for url in urls:
-            tab_print(f"Scraping content from {url}")
-            content = scrape_text_from_url(url)
-            # Summarize content to avoid token limits
-            summarized_content = summarize_text(content)
-            url_contents[url] = summarized_content
-
-        # Add URL contents to issue details
-        details['url_contents'] = url_contents
-
-    user = create_user_agent()
-    generate_edit_command_assistant = create_agent(
-        "generate_edit_command_assistant", llm_config)
     if summarized_comments:
         generate_edit_command_prompt = generate_prompt(
             "generate_edit_command_assistant",
@@ -593,6 +872,9 @@ def generate_edit_command_response(
             repo_name, repo_path, details, issue
         )
 
+    user = create_user_agent()
+    generate_edit_command_assistant = create_agent(
+        "generate_edit_command_assistant", llm_config)
     chat_config = dict(
         silent=params['print_llm_output'],
         recipient=generate_edit_command_assistant,
@@ -600,7 +882,10 @@ def generate_edit_command_response(
         max_turns=20,
         summary_method="reflection_with_llm",
     )
-    chat_results = user.initiate_chats([chat_config])
+    try:
+        chat_results = user.initiate_chats([chat_config])
+    finally:
+        release_agents(user, generate_edit_command_assistant)
 
     for this_chat in chat_results[0].chat_history[::-1]:
         this_content = this_chat['content']
@@ -608,11 +893,7 @@ def generate_edit_command_response(
             response = this_content
             break
     all_content = [response]
-    # Clean the response first to remove any existing signatures
-    response = clean_response(response)
-    signature = f"\n\n---\n*This response was automatically generated by blech_bot using model {llm_config['model']}*"
-    if signature not in response:
-        response += signature
+    response = finalize_response(response)
     return response, all_content
 
 ############################################################
@@ -678,12 +959,9 @@ def write_pr_comment(
         aider_output: The output from the aider command
         llm_config: The configuration for the LLM used to generate the response
     """
-    # Clean the response first to remove any existing signatures
-    write_str = clean_response(response)
-    signature = f"\n\n---\n*This response was automatically generated by blech_bot using model {llm_config['model']}*"
-    if signature not in write_str:
-        write_str += signature
+    write_str = finalize_response(response)
     pr_obj.create_issue_comment(write_str)
+    invalidate_comment_cache(pr_obj)
 
 
 def develop_issue_flow(
@@ -795,9 +1073,10 @@ def respond_pr_comment_flow(
         repo = get_repository(get_github_client(), repo_name)
 
         # Get latest user comment
-        extractor = URLExtract()
-        urls = extractor.find_urls(pr_comment)[0]
-        pr_number = int(urls.split('/')[-1])
+        pr_numbers = get_pr_numbers(pr_comment)
+        if not pr_numbers:
+            raise ValueError(f"No pull request link found in: {pr_comment}")
+        pr_number = pr_numbers[0]
         pr = repo.get_pull(pr_number)
 
         # comments = list(pr.get_issue_comments())
@@ -1079,6 +1358,53 @@ def process_issue(
         return False, f"ERROR: {error_msg}"
 
 
+# Characters of aider output that are kept. The output is posted in
+# GitHub comments, which are limited to 65536 characters.
+aider_output_limit = 50_000
+
+
+def _run_capped(cmd: List[str], cwd: str) -> str:
+    """
+    Run a command, keeping at most aider_output_limit characters of stdout
+
+    stdout is read as it is produced and anything past the limit is
+    discarded, so a very chatty run doesn't pile up in memory. The process
+    is left to finish, since stopping aider part way could leave a
+    half-applied edit.
+
+    Raises:
+        subprocess.CalledProcessError: If the command fails, as with
+            subprocess.run(check=True)
+    """
+    with subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True) as proc:
+        # Drain stderr alongside stdout so neither pipe can fill up and
+        # block the process
+        stderr = []
+        stderr_thread = threading.Thread(
+            target=lambda: stderr.append(proc.stderr.read()))
+        stderr_thread.start()
+
+        kept = []
+        n_kept = 0
+        n_total = 0
+        for chunk in iter(lambda: proc.stdout.read(65536), ''):
+            n_total += len(chunk)
+            if n_kept < aider_output_limit:
+                kept.append(chunk[:aider_output_limit - n_kept])
+                n_kept += len(kept[-1])
+        stderr_thread.join()
+        returncode = proc.wait()
+
+    stdout = "".join(kept)
+    if n_total > n_kept:
+        stdout += f"\n[... {n_total - n_kept} characters of output truncated ...]"
+    if returncode:
+        raise subprocess.CalledProcessError(
+            returncode, cmd, output=stdout, stderr="".join(stderr))
+    return stdout
+
+
 def run_aider(message: str, repo_path: str) -> str:
     """
     Run aider with a given message string
@@ -1095,53 +1421,33 @@ def run_aider(message: str, repo_path: str) -> str:
         FileNotFoundError: If aider is not installed
     """
     try:
-        # Change to repo directory
-        original_dir = os.getcwd()
-        os.chdir(repo_path)
-
         # Current commit
-        current_commit = git.Repo(repo_path).head.object.hexsha
+        current_commit = get_current_commit(repo_path)
 
         # Run aider with the message and specified model from params.json
         aider_model = params.get("aider_model", "gpt-4o")
-        result = subprocess.run(
-            ['aider', '--model', aider_model,
-                '--yes-always', '--message', message],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        if 'Re-run aider to use new version' in result.stdout:
+        aider_cmd = ['aider', '--model', aider_model,
+                     '--yes-always', '--message', message]
+        output = _run_capped(aider_cmd, repo_path)
+        if 'Re-run aider to use new version' in output:
             # Re-run with the same model if we get a version update message
-            result = subprocess.run(
-                ['aider', '--model', aider_model,
-                    '--yes-always', '--message', message],
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            output = _run_capped(aider_cmd, repo_path)
 
         # Check if there are any changes
-        updated_commit = git.Repo(repo_path).head.object.hexsha
+        updated_commit = get_current_commit(repo_path)
         if current_commit == updated_commit:
             raise RuntimeError("No changes made by Aider")
 
-        # Return to original directory
-        os.chdir(original_dir)
-
-        return result.stdout
+        return output
 
     except FileNotFoundError:
         error_msg = "Aider not found. Please install it first with 'pip install aider-chat'"
-        os.chdir(original_dir) if 'original_dir' in locals() else None
         raise ValueError(error_msg)
     except subprocess.CalledProcessError as e:
         error_msg = f"Failed to run aider: {e.stderr}"
-        os.chdir(original_dir) if 'original_dir' in locals() else None
         raise RuntimeError(error_msg)
     except Exception as e:
         error_msg = f"Unexpected error running aider: {str(e)}\n\n```\n{traceback.format_exc()}\n```"
-        os.chdir(original_dir) if 'original_dir' in locals() else None
         raise RuntimeError(error_msg)
 
 
@@ -1159,12 +1465,17 @@ def process_repository(
         client = get_github_client()
         repo = get_repository(client, repo_name)
 
+        # Repositories may have been cloned or removed since the last pass,
+        # so look them up again instead of using the tools' cached paths
+        bot_tools.refresh_repos()
+
         # Get local repository path
         repo_dir = bot_tools.get_local_repo_path(repo_name)
 
         # Clone repository only if not already present
         if not os.path.exists(repo_dir):
             repo_dir = clone_repository(repo)
+            bot_tools.refresh_repos()
 
         # Determine the default branch
         default_branch = repo.default_branch
@@ -1223,7 +1534,7 @@ def initialize_bot() -> None:
             os.path.dirname(os.path.abspath(__file__)))
 
         # Update the bot's own repository
-        from git_utils import update_self_repo
+        from src.git_utils import update_self_repo
         print(f"Updating bot repository at {self_repo_path}")
         update_performed = update_self_repo(self_repo_path)
         if update_performed:
@@ -0,0 +1,150 @@
+import ast
+import json
+import unittest
+from unittest.mock import patch
+
+from src import agents
+from src.agents import (
+    _check_codeact_program,
+    is_terminate_msg,
+    parse_comment_summaries,
+    run_codeact_program,
+)
+
+
+ALLOWED_CALLS = {'print', 'len', 'range', 'readfile'}
+
+
+class TestCheckCodeactProgram(unittest.TestCase):
+
+    def check(self, code):
+        _check_codeact_program(ast.parse(code), ALLOWED_CALLS)
+
+    def test_allowed_program(self):
+        self.check("for i in range(3):\n    print(len(readfile('x.py')))\n")
+
+    def test_rejects_import(self):
+        with self.assertRaisesRegex(ValueError, 'Import is not allowed'):
+            self.check("import os\n")
+        with self.assertRaisesRegex(ValueError, 'ImportFrom is not allowed'):
+            self.check("from os import path\n")
+
+    def test_rejects_private_attribute(self):
+        with self.assertRaisesRegex(ValueError, 'Attribute __class__'):
+            self.check("print(''.__class__)\n")
+
+    def test_rejects_format(self):
+        with self.assertRaisesRegex(ValueError, 'Attribute format'):
+            self.check("print('{0.__class__}'.format(1))\n")
+
+    def test_rejects_private_name(self):
+        with self.assertRaisesRegex(ValueError, 'Name __builtins__'):
+            self.check("print(__builtins__)\n")
+
+    def test_rejects_unknown_call(self):
+        with self.assertRaisesRegex(ValueError, 'Call to open'):
+            self.check("open('x.py')\n")
+
+    def test_rejects_definitions(self):
+        with self.assertRaisesRegex(ValueError, 'FunctionDef'):
+            self.check("def f():\n    pass\n")
+        with self.assertRaisesRegex(ValueError, 'Lambda'):
+            self.check("f = lambda: 1\n")
+
+
+class TestRunCodeactProgram(unittest.TestCase):
+
+    def test_runs_code_block(self):
+        reply = "Here it is:\n```python\nprint(sum(range(5)))\n```\n"
+        self.assertEqual(run_codeact_program(reply), "10\n")
+
+    def test_rejected_program_is_not_run(self):
+        output = run_codeact_program("```python\nimport os\nprint('ran')\n```")
+        self.assertIn("Error running program: ValueError", output)
+        self.assertNotIn("ran", output)
+
+    def test_runtime_error_is_reported(self):
+        output = run_codeact_program("```python\nprint(1)\nprint(1 / 0)\n```")
+        self.assertTrue(output.startswith("1\n"))
+        self.assertIn("ZeroDivisionError", output)
+
+    def test_builtins_are_restricted(self):
+        # getattr is not whitelisted, so the name is undefined in the child
+        output = run_codeact_program(
+            "```python\nprint(len([getattr]))\n```")
+        self.assertIn("Error running program", output)
+
+    def test_output_is_truncated(self):
+        with patch.object(agents, 'codeact_output_limit', 100):
+            output = run_codeact_program(
+                "```python\nfor i in range(10000):\n    print(i)\n```")
+        self.assertTrue(output.endswith("[... output truncated ...]"))
+        self.assertLess(len(output), 200)
+
+    def test_timeout(self):
+        with patch.object(agents, 'codeact_timeout', 1):
+            output = run_codeact_program("```python\nwhile True:\n    pass\n```")
+        self.assertIn("TimeoutError: stopped after 1 seconds", output)
+
+    def test_memory_limit(self):
+        try:
+            import resource  # noqa
+        except ImportError:
+            self.skipTest("resource limits are not available")
+        output = run_codeact_program("```python\nx = [0] * (10 ** 10)\n```")
+        self.assertIn("MemoryError", output)
+
+
+class TestParseCommentSummaries(unittest.TestCase):
+
+    def test_valid_reply(self):
+        reply = "```json\n" + json.dumps([
+            {"comment": 1, "relevant": True, "summary": "first"},
+            {"comment": 2, "relevant": False, "summary": "ignored"},
+            {"comment": 3, "relevant": True, "summary": "third"},
+        ]) + "\n```"
+        self.assertEqual(parse_comment_summaries(reply, 3),
+                         ["first", "", "third"])
+
+    def test_malformed_json_keeps_reply(self):
+        reply = '[{"comment": 1, "relevant": true, "summary": "cut off'
+        self.assertEqual(parse_comment_summaries(reply, 2), [reply])
+        reply = '[{"comment": 1, "relevant": true,}]'
+        self.assertEqual(parse_comment_summaries(reply, 1), [reply])
+
+    def test_no_json(self):
+        self.assertEqual(parse_comment_summaries("Nothing relevant", 2),
+                         ["Nothing relevant"])
+        self.assertEqual(parse_comment_summaries(None, 2), [""])
+
+    def test_bad_entries_are_skipped(self):
+        reply = json.dumps([
+            "not a dict",
+            {"comment": 7, "relevant": True, "summary": "out of range"},
+            {"comment": "2", "relevant": True, "summary": "not an int"},
+            {"relevant": True, "summary": "position"},
+        ])
+        self.assertEqual(parse_comment_summaries(reply, 4),
+                         ["", "", "", "position"])
+
+
+class TestIsTerminateMsg(unittest.TestCase):
+
+    def test_terminate_at_end(self):
+        self.assertTrue(is_terminate_msg({'content': "Done.\nTERMINATE"}))
+        self.assertTrue(is_terminate_msg({'content': "TERMINATE."}))
+        self.assertTrue(is_terminate_msg({'content': "Done TERMINATE \n"}))
+
+    def test_no_terminate(self):
+        self.assertFalse(is_terminate_msg({'content': "TERMINATE the loop"}))
+        self.assertFalse(is_terminate_msg({'content': ""}))
+        self.assertFalse(is_terminate_msg({'content': None}))
+        self.assertFalse(is_terminate_msg({}))
+
+    def test_long_message(self):
+        content = "x" * 10_000 + " TERMINATE"
+        self.assertTrue(is_terminate_msg({'content': content}))
+
+
+if __name__ == '__main__':
+    unittest.main()
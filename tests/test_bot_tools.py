@@ -0,0 +1,110 @@
+import os  # noqa
+import tempfile  # noqa
+import textwrap  # noqa
+
+from src import bot_tools
+from src.bot_tools import get_func_code, readfile, readfiles
+import unittest
+
+
+MODULE_SOURCE = textwrap.dedent('''\
+    import functools
+
+
+    def helper(x):
+        return x + 1
+
+
+    class Foo:
+        @functools.lru_cache
+        def bar(self,
+                y):
+            return y * 2
+
+        async def baz(self):
+            return None
+
+
+    def read_data(path):
+        return path
+    ''')
+
+
+class TestGetFuncCode(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.module_path = os.path.join(self.tmpdir.name, 'module.py')
+        with open(self.module_path, 'w') as f:
+            f.write(MODULE_SOURCE)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_top_level_function(self):
+        code = get_func_code(self.module_path, 'helper')
+        self.assertEqual(code, "def helper(x):\n    return x + 1\n")
+
+    def test_method_includes_decorator_and_multiline_signature(self):
+        code = get_func_code(self.module_path, 'bar')
+        self.assertTrue(code.lstrip().startswith('@functools.lru_cache'))
+        self.assertIn('return y * 2', code)
+        self.assertNotIn('baz', code)
+
+    def test_qualified_name(self):
+        code = get_func_code(self.module_path, 'Foo.baz')
+        self.assertIn('async def baz(self):', code)
+
+    def test_partial_name_falls_back_to_search(self):
+        code = get_func_code(self.module_path, 'read')
+        self.assertIn('def read_data(path):', code)
+
+    def test_missing_function(self):
+        code = get_func_code(self.module_path, 'does_not_exist')
+        self.assertIn('not found', code)
+
+    def test_file_change_is_picked_up(self):
+        get_func_code(self.module_path, 'helper')
+        with open(self.module_path, 'a') as f:
+            f.write("\n\ndef added():\n    return 'new'\n")
+        code = get_func_code(self.module_path, 'added')
+        self.assertIn("return 'new'", code)
+
+
+class TestReadfiles(unittest.TestCase):
+
+    def test_results_keep_input_order(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for i in range(3):
+                path = os.path.join(tmpdir, f'file_{i}.txt')
+                with open(path, 'w') as f:
+                    f.write(f'content {i}\n')
+                paths.append(path)
+            output = readfiles(paths)
+        positions = [output.index(f'content {i}') for i in range(3)]
+        self.assertEqual(positions, sorted(positions))
+        for path in paths:
+            self.assertIn(f'File: {path}', output)
+
+
+class TestReadfileLargeFile(unittest.TestCase):
+
+    def test_matches_small_file_path(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'large.py')
+            with open(path, 'w') as f:
+                f.write('a b c d\n' * (bot_tools.large_file_size // 4))
+            streamed = readfile(path)
+            original_size = bot_tools.large_file_size
+            bot_tools.large_file_size = float('inf')
+            try:
+                full = readfile(path)
+            finally:
+                bot_tools.large_file_size = original_size
+        self.assertIn('exceeds token threshold', streamed)
+        self.assertEqual(streamed.split('\n\n')[0], full.split('\n\n')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from src import git_utils
+from src.git_utils import (
+    _cache_get,
+    _cache_set,
+    get_pr_numbers,
+    get_pull_request,
+    invalidate_comment_cache,
+)
+
+
+class TestApiCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = {}
+
+    def test_get_missing(self):
+        self.assertIsNone(_cache_get(self.cache, 'key'))
+
+    def test_set_and_get(self):
+        _cache_set(self.cache, 'key', 'value')
+        self.assertEqual(_cache_get(self.cache, 'key'), 'value')
+
+    def test_expired_entry_is_dropped(self):
+        with patch.object(git_utils.time, 'monotonic', return_value=100.0):
+            _cache_set(self.cache, 'key', 'value')
+        expired = 100.0 + git_utils.api_cache_ttl + 1
+        with patch.object(git_utils.time, 'monotonic', return_value=expired):
+            self.assertIsNone(_cache_get(self.cache, 'key'))
+        self.assertNotIn('key', self.cache)
+
+    def test_oldest_entry_is_evicted(self):
+        with patch.object(git_utils, 'api_cache_maxsize', 2):
+            _cache_set(self.cache, 'a', 1)
+            _cache_set(self.cache, 'b', 2)
+            # Storing an existing key again doesn't evict anything
+            _cache_set(self.cache, 'b', 3)
+            self.assertEqual(list(self.cache), ['a', 'b'])
+            _cache_set(self.cache, 'c', 4)
+        self.assertEqual(list(self.cache), ['b', 'c'])
+        self.assertEqual(_cache_get(self.cache, 'b'), 3)
+
+    def test_invalidate_comment_cache(self):
+        issue = Mock(url='https://api.github.com/repos/o/r/issues/1')
+        other = Mock(url='https://api.github.com/repos/o/r/issues/2')
+        with patch.object(git_utils, '_comment_cache', {}):
+            _cache_set(git_utils._comment_cache, (issue.url, 'then'), [])
+            _cache_set(git_utils._comment_cache, (issue.url, 'now'), [])
+            _cache_set(git_utils._comment_cache, (other.url, 'now'), [])
+            invalidate_comment_cache(issue)
+            self.assertEqual(list(git_utils._comment_cache),
+                             [(other.url, 'now')])
+
+    def test_get_pull_request_is_cached(self):
+        repo = Mock(full_name='owner/repo')
+        with patch.object(git_utils, '_pull_cache', {}):
+            first = get_pull_request(repo, 3)
+            second = get_pull_request(repo, 3)
+            get_pull_request(repo, 4)
+        self.assertIs(first, second)
+        self.assertEqual(repo.get_pull.call_count, 2)
+
+
+class TestGetPrNumbers(unittest.TestCase):
+
+    def test_finds_numbers_in_order(self):
+        text = ("Created https://github.com/owner/repo/pull/12 and "
+                "https://github.com/owner/repo/pull/3")
+        self.assertEqual(get_pr_numbers(text), [12, 3])
+
+    def test_removes_duplicates(self):
+        text = "/pull/5 then /pull/7 then /pull/5 again"
+        self.assertEqual(get_pr_numbers(text), [5, 7])
+
+    def test_no_links(self):
+        self.assertEqual(get_pr_numbers("No pull request here"), [])
+        self.assertEqual(get_pr_numbers(""), [])
+        self.assertEqual(get_pr_numbers(None), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import os  # noqa
+import unittest
+
+# response_agent reads the API key when it is imported
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+from src.response_agent import check_not_empty  # noqa: E402
+
+
+class TestCheckNotEmpty(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertFalse(check_not_empty(""))
+        self.assertFalse(check_not_empty(None))
+        self.assertFalse(check_not_empty("..."))
+
+    def test_terminate_only(self):
+        self.assertFalse(check_not_empty("TERMINATE"))
+        self.assertFalse(check_not_empty("terminate."))
+        self.assertFalse(check_not_empty("**TERMINATE**"))
+
+    def test_content(self):
+        self.assertTrue(check_not_empty("Some response"))
+        self.assertTrue(check_not_empty("Response\nTERMINATE"))
+        self.assertTrue(check_not_empty("terminated"))
+
+
+if __name__ == '__main__':
+    unittest.main()